@@ -1,4 +1,4 @@
-import json
+import argparse
 import os
 import sys
 
@@ -21,10 +21,28 @@ HEADER_FILL = ['4CAF50', '4CAF50', 'solid']
 # This would be in the root directory where this __main__.py file is located.
 LOG_DIR = 'logs'
 
+# LOG_FORMAT should be a string
+# 'text' writes the classic YYYYMMDD.log files, 'jsonl' writes one JSON object per line to YYYYMMDD.jsonl.
+LOG_FORMAT = 'text'
+
 # PROCESSED_DIR is used to set the processed directory that will be created in the found PDF directory.
 # This is where the processed Excel files will be stored.
 PROCESSED_DIR = 'processed'
 
+# CACHE_PATH should be a string
+# SQLite file that caches extracted PDF text by content hash, relative to this __main__.py file.
+# Set to '' to disable the cache.
+CACHE_PATH = 'cache/extract.sqlite'
+
+# CACHE_MAX_MB should be an integer
+# Least recently used entries are evicted once the cache grows past this size.
+CACHE_MAX_MB = 1024
+
+# TEMPLATES_PATH should be a string
+# JSON registry of known invoice layouts, relative to this __main__.py file.
+# Set to '' to parse every invoice with the generic rules.
+TEMPLATES_PATH = 'templates.json'
+
 # CELL_PHONE should be a string array
 # EDIT THIS AS NEEDED
 CELL_PHONE = ['Cell', 'Mobile', 'iPhone']
@@ -37,13 +55,10 @@ MAIN_PHONE = ['Tel', 'Main', 'Home', 'Office', 'Phone', 'Telephone']
 
 ## DO NOT CHANGE ANYTHING BELOW THIS LINE ##
 
-# This sets the environment variables for the program.
-os.environ['CELL_PHONE'] = json.dumps(CELL_PHONE)
+# The logger reads these from the environment.
 os.environ['FORCE_DEBUG'] = str(FORCE_DEBUG)
-os.environ['HEADER_FILL'] = json.dumps(HEADER_FILL)
-os.environ['MAIN_PHONE'] = json.dumps(MAIN_PHONE)
 os.environ['LOG_DIR'] = str(LOG_DIR)
-os.environ['PROCESSED_DIR'] = str(PROCESSED_DIR)
+os.environ['LOG_FORMAT'] = str(LOG_FORMAT)
 os.environ['TK_SILENCE_DEPRECATION'] = '1'
 
 # This sets the root directory to the parent directory of this __main__.py file.
@@ -53,7 +68,164 @@ sys.path.append(str(parent_path))
 
 # This is the auto-start for the program.
 if __name__ == "__main__":
-    from core.process import batch_convert
-    from core.filer import select_folder
-    os.system('cls' if os.name == 'nt' else 'clear')
-    batch_convert(select_folder())
+    arg_parser = argparse.ArgumentParser(
+        description="Batch convert invoice PDFs to Excel spreadsheets.")
+    arg_parser.add_argument(
+        "path", nargs="?",
+        help="folder to process (default: prompt for a folder; required when "
+             "headless)")
+    arg_parser.add_argument(
+        "--headless", action="store_true",
+        help="never clear the screen, prompt or open a folder dialog (implied "
+             "when not attached to a terminal, e.g. under cron)")
+    arg_parser.add_argument(
+        "--dry-run", action="store_true",
+        help="list the PDFs that would be converted and exit")
+    arg_parser.add_argument(
+        "--include", action="append", metavar="GLOB",
+        help="only convert PDFs whose path (relative to the folder) or name "
+             "matches; may be repeated")
+    arg_parser.add_argument(
+        "--exclude", action="append", metavar="GLOB",
+        help="skip PDFs and folders whose relative path matches; may be repeated")
+    arg_parser.add_argument(
+        "--max-depth", type=int, metavar="N",
+        help="descend at most N folders below the folder (0 = the folder only)")
+    arg_parser.add_argument(
+        "--workers", type=int,
+        help="number of worker processes (default: CPU count, 1 = serial)")
+    arg_parser.add_argument(
+        "--timeout", type=float, metavar="SECONDS",
+        help="stop a PDF that takes longer than this and quarantine it "
+             "(default: 120, 0 = no limit)")
+    arg_parser.add_argument(
+        "--memory-mb", type=int, metavar="MB",
+        help="stop a PDF whose worker process grows past this much memory and "
+             "quarantine it (default: 0 = no limit)")
+    arg_parser.add_argument(
+        "--worker-max-files", type=int, metavar="N",
+        help="replace each worker process after N PDFs (default: 200)")
+    arg_parser.add_argument(
+        "--force", action="store_true",
+        help="reconvert every PDF, even if it has not changed since the last "
+             "run, including quarantined ones")
+    arg_parser.add_argument(
+        "--resume", action="store_true",
+        help="continue an interrupted run: PDFs it already converted (per "
+             "<path>/processed/run-journal.jsonl) are not converted again")
+    arg_parser.add_argument(
+        "--dedup", choices=["off", "flag", "skip"],
+        help="duplicate invoices across folders and runs: flag (default) skips "
+             "byte-identical copies of converted PDFs and reports PDFs that "
+             "repeat an invoice number / purchase order; skip also skips those; "
+             "off converts every copy")
+    arg_parser.add_argument(
+        "--format", choices=["xlsx", "csv", "jsonl"],
+        help="output format (default: xlsx); csv and jsonl skip pandas and openpyxl")
+    arg_parser.add_argument(
+        "--schema", choices=["wide", "normalized"],
+        help="wide: one row per invoice with numbered product columns "
+             "(default); normalized: an invoices table plus a line_items table "
+             "keyed by invoice number, with numeric prices and quantities")
+    arg_parser.add_argument(
+        "--consolidate", nargs="?", const="", metavar="XLSX",
+        help="write one row per invoice into a single file instead of one "
+             "file per PDF (default: <path>/processed/consolidated.<format>)")
+    arg_parser.add_argument(
+        "--sheet-per-dir", action="store_true",
+        help="with --consolidate, write one sheet per subdirectory")
+    arg_parser.add_argument(
+        "--no-cache", action="store_true",
+        help="do not read or write the extracted text cache")
+    arg_parser.add_argument(
+        "--extractor", choices=["pdfplumber", "pdfminer"],
+        help="text extraction backend (default: pdfplumber)")
+    arg_parser.add_argument(
+        "--report", metavar="JSON",
+        help="write the run report (stage timings, slowest files, failures) "
+             "here instead of <path>/processed/run-report.json; '' only logs it")
+    arg_parser.add_argument(
+        "--watch", action="store_true",
+        help="keep running and convert new PDFs as they arrive")
+    arg_parser.add_argument(
+        "--poll", action="store_true",
+        help="with --watch, poll for changes instead of using inotify")
+    arg_parser.add_argument(
+        "--compare-extractors", nargs="?", const="", metavar="JSON",
+        help="instead of converting, run every extractor over the PDFs and "
+             "report time, peak memory and whether the mapped output matches "
+             "(optionally saving the full report as JSON)")
+    args = arg_parser.parse_args()
+
+    from core.settings import load_settings
+
+    # Settings are resolved once: defaults < .env / environment < the
+    # adjustable variables above < command line flags.
+    cache_path = '' if args.no_cache or not CACHE_PATH else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), CACHE_PATH)
+    templates_path = TEMPLATES_PATH and os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), TEMPLATES_PATH)
+    settings = load_settings({
+        'cache_max_mb': CACHE_MAX_MB,
+        'cache_path': cache_path,
+        'cell_phone': CELL_PHONE,
+        'header_fill': HEADER_FILL,
+        'main_phone': MAIN_PHONE,
+        'processed_dir': PROCESSED_DIR,
+        'templates_path': templates_path,
+        'workers': args.workers,
+        'file_timeout': args.timeout,
+        'file_memory_mb': args.memory_mb,
+        'worker_max_files': args.worker_max_files,
+        'force': args.force,
+        'resume': args.resume,
+        'dedup': args.dedup,
+        'consolidated_path': args.consolidate,
+        'sheet_per_directory': args.sheet_per_dir,
+        'extractor': args.extractor,
+        'report_path': args.report,
+        'output_format': args.format,
+        'include': args.include,
+        'exclude': args.exclude,
+        'max_depth': args.max_depth,
+        'schema': args.schema,
+    })
+
+    headless = args.headless or not (sys.stdin.isatty() and sys.stdout.isatty())
+    if args.path:
+        target_dir = args.path
+    elif headless:
+        # Unattended runs must name their folder; guessing the working
+        # directory could convert whatever cron happens to start in.
+        arg_parser.error("a folder path is required when headless (or not attached to a terminal)")
+    else:
+        from core.filer import select_folder
+        target_dir = select_folder()
+    if not headless:
+        os.system('cls' if os.name == 'nt' else 'clear')
+
+    if args.dry_run:
+        from core.process import discover_pdfs, get_quarantine_path, open_dedup_index
+        from core.quarantine import load_quarantine
+        quarantine = load_quarantine(get_quarantine_path(target_dir, settings))
+        dedup = open_dedup_index(target_dir, settings)
+        pending = 0
+        for pdf in discover_pdfs(target_dir, settings, {}, quarantine=quarantine, dedup=dedup):
+            if pdf.skip is None:
+                pending += 1
+                print(f"{pdf.pdf_path} -> {pdf.excel_path}")
+        print(f"{pending} PDF(s) to convert in {target_dir}")
+    elif args.compare_extractors is not None:
+        from core.compare import compare_extractors, format_comparison
+        from core.extract import EXTRACTORS
+        from core.scan import scan_pdfs
+        pdf_paths = [pdf.path for pdf in scan_pdfs(target_dir, settings)]
+        report = compare_extractors(
+            pdf_paths, tuple(EXTRACTORS), settings, args.compare_extractors or None)
+        print(format_comparison(report))
+    elif args.watch:
+        from core.watch import watch_folder
+        watch_folder(target_dir, settings, polling=args.poll)
+    else:
+        from core.process import batch_convert
+        sys.exit(0 if batch_convert(target_dir, settings) else 1)
@@ -0,0 +1,129 @@
+import os
+import random
+
+from typing import List, Sequence
+
+
+# The three product table headers find_header_fill_index knows about.
+HEADERS = [
+    "Product Description Cost per Item Qty Price",
+    "Product Description Unit Price Quantity Amount",
+    "Description Quantity Price Total Price",
+]
+
+COMPANIES = [
+    "SW Firefighting Foam & Equipment, LLC", "Desert Fire District",
+    "Mesa Volunteer Fire Company", "Pinal County Emergency Services",
+]
+STREETS = ["Main Street", "Camelback Road", "Central Avenue", "Indian School Rd"]
+CITIES = ["Phoenix, AZ 85001", "Tempe, AZ 85281", "Mesa, AZ 85201", "Tucson, AZ 85701"]
+SECOND_LINES = ["Suite 4", "Building B", "Receiving Dock", "Station 12"]
+NAMES = ["John Smith", "Maria Lopez", "Dana White", "Chris Young", "Sam Patel"]
+PHONE_PREFIXES = ["Tel", "Main", "Office", "Cell", "Mobile"]
+PRODUCTS = [
+    "Foam Concentrate 5gal", "AFFF 3% Drum", "Nozzle Kit", "Hose 50ft",
+    "Eductor Assembly", "Turnout Gloves", "Foam Tote 275gal", "Gauge Set",
+]
+MONTHS = [
+    "January", "February", "March", "April", "May", "June", "July",
+    "August", "September", "October", "November", "December",
+]
+
+LINES_PER_PAGE = 60
+PAGE_TOP = 760
+LINE_HEIGHT = 12
+
+
+def build_invoice_lines(rng: random.Random, number: int) -> List[str]:
+    lines = [rng.choice(COMPANIES)]
+
+    year, month, day = rng.choice([2023, 2024, 2025]), rng.randint(1, 12), rng.randint(1, 28)
+    if rng.random() < 0.5:
+        lines.append(f"{MONTHS[month - 1]} {day}, {year}")
+    else:
+        lines.append(f"{month}/{day}/{str(year)[2:]}")
+
+    if rng.random() < 0.3:
+        lines.append(f"PO Box {rng.randint(10, 9999)}")
+    else:
+        lines.append(f"{rng.randint(10, 9999)} {rng.choice(STREETS)}")
+        if rng.random() < 0.5:
+            lines.append(rng.choice(SECOND_LINES))
+    lines.append(rng.choice(CITIES))
+
+    for name in rng.sample(NAMES, rng.randint(1, 3)):
+        lines.append(name)
+    lines.append(
+        f"{rng.choice(PHONE_PREFIXES)} {rng.randint(200, 999)}-555-{rng.randint(1000, 9999)}")
+    if rng.random() < 0.8:
+        lines.append(f"billing{number}@example.com")
+
+    lines.append(rng.choice(HEADERS))
+    for _ in range(rng.choice([1, 2, 3, 5, 10, 25, 60])):
+        quantity = rng.randint(1, 12)
+        price = rng.randint(500, 150000) / 100
+        lines.append(
+            f"{rng.choice(PRODUCTS)} ${price:,.2f} {quantity} ${price * quantity:,.2f}")
+
+    freight = rng.randint(0, 20000) / 100
+    lines.append(f"Freight: ${freight:.2f}" if rng.random() < 0.5 else f"Freight ${freight:.2f}")
+    lines.append(f"Invoice: {100000 + number}")
+    if rng.random() < 0.8:
+        lines.append(f"Purchase Order: PO-{rng.randint(1000, 99999)}")
+    return lines
+
+
+def generate_corpus(directory: str, size: int, seed: int = 0) -> List[str]:
+    # Same seed and size always produce byte-identical files.
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for number in range(size):
+        lines = build_invoice_lines(rng, number)
+        pages = [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)]
+        path = os.path.join(directory, f"invoice_{number:05d}.pdf")
+        write_pdf(path, pages)
+        paths.append(path)
+    return paths
+
+
+def pdf_string(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: Sequence[Sequence[str]]) -> None:
+    # Minimal PDF 1.4 writer: one Helvetica text stream per page. Enough for
+    # pdfplumber/pdfminer to extract one text line per input line.
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    page_ids = []
+    for lines in pages:
+        content = [f"BT /F1 10 Tf {LINE_HEIGHT} TL 50 {PAGE_TOP} Td"]
+        content.extend(f"({pdf_string(line)}) Tj T*" for line in lines)
+        content.append("ET")
+        stream = "\n".join(content).encode("latin-1")
+        objects.append(
+            b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(data)
@@ -0,0 +1,142 @@
+import importlib.util
+import os
+import random
+import signal
+import subprocess
+import tempfile
+
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bench.corpus import build_invoice_lines
+
+
+# Seconds one mapping may take before it counts as hung. Parsers before the
+# single forward pass could loop forever on some scrambled layouts.
+MAPPING_TIMEOUT = 0.5
+SAMPLE_DIFFERENCES = 3
+
+Mapper = Callable[[str], Any]
+
+
+class MappingTimeout(BaseException):
+    pass
+
+
+def build_texts(count: int, seed: int) -> List[str]:
+    # Each corpus invoice plus a scrambled variant (a random subset of its
+    # lines in random order), which exercises the fallbacks: missing dates,
+    # headers or freight lines and references in odd places.
+    rng = random.Random(seed)
+    texts = []
+    for number in range(count):
+        lines = build_invoice_lines(rng, number)
+        texts.append('\n'.join(lines))
+        texts.append('\n'.join(rng.sample(lines, rng.randint(3, min(14, len(lines))))))
+    return texts
+
+
+def compare_mappers(texts: List[str], old: Mapper, new: Mapper) -> Dict:
+    # Rows must match in values and in column order.
+    differences = []
+    for text in texts:
+        before, after = run_mapper(old, text), run_mapper(new, text)
+        if before != after or (
+                isinstance(before, dict) and isinstance(after, dict) and
+                list(before) != list(after)):
+            differences.append({'text': text, 'old': before, 'new': after})
+    return {
+        'texts': len(texts),
+        'differences': len(differences),
+        'samples': differences[:SAMPLE_DIFFERENCES],
+    }
+
+
+def count_identified(texts: List[str], templates_path: str) -> int:
+    # How many texts a layout template recognises; a template check over
+    # texts no template matches proves nothing.
+    from core.template import get_templates, identify_template
+
+    templates = get_templates(templates_path)
+    return sum(
+        identify_template(text.strip().split('\n'), templates) is not None for text in texts)
+
+
+def format_comparison(name: str, comparison: Dict) -> str:
+    lines = [f"{name}: {comparison['differences']} of {comparison['texts']} texts differ"]
+    for sample in comparison['samples']:
+        lines.append('')
+        lines.append(sample['text'])
+        lines.append(f"  old: {sample['old']}")
+        lines.append(f"  new: {sample['new']}")
+    return '\n'.join(lines)
+
+
+def load_revision(revision: str) -> ModuleType:
+    # core/process.py as of a git revision, importing the current versions
+    # of its sibling modules.
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    source = subprocess.check_output(
+        ['git', 'show', f'{revision}:core/process.py'], cwd=package_dir)
+    with tempfile.NamedTemporaryFile('wb', suffix='.py', delete=False) as f:
+        f.write(source)
+    try:
+        spec = importlib.util.spec_from_file_location(f'process_{revision}', f.name)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.remove(f.name)
+    return module
+
+
+def revision_mapper(revision: Optional[str]) -> Mapper:
+    # None maps with the working tree. Older revisions only had the
+    # DataFrame mapping.
+    if revision is None:
+        import core.process as module
+    else:
+        module = load_revision(revision)
+    if hasattr(module, 'map_text_to_columns'):
+        return module.map_text_to_columns
+
+    def map_through_dataframe(text: str) -> Dict:
+        dataframe = module.map_text_to_excel_columns(text)
+        return {} if dataframe.empty else dataframe.iloc[0].to_dict()
+    return map_through_dataframe
+
+
+def run_mapper(mapper: Mapper, text: str) -> Any:
+    # Errors and hangs are results too, so a parser that starts raising or
+    # looping shows up as a difference.
+    def stop(*_):
+        raise MappingTimeout()
+
+    timer = hasattr(signal, 'setitimer')
+    if timer:
+        previous = signal.signal(signal.SIGALRM, stop)
+        signal.setitimer(signal.ITIMER_REAL, MAPPING_TIMEOUT)
+    try:
+        return mapper(text)
+    except MappingTimeout:
+        return ('hung',)
+    except Exception as e:
+        return ('error', type(e).__name__)
+    finally:
+        if timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+def template_mappers(templates_path: str) -> Tuple[Mapper, Mapper]:
+    # The working tree's mapping without and with the layout templates.
+    from dataclasses import replace
+
+    from core.process import map_text_to_columns
+    from core.settings import load_settings
+
+    settings = load_settings({'cache_path': ''})
+    generic = replace(settings, templates_path=None)
+    templated = replace(settings, templates_path=templates_path)
+    return (
+        lambda text: map_text_to_columns(text, generic),
+        lambda text: map_text_to_columns(text, templated))
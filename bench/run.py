@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+from bench.corpus import generate_corpus
+from core.timing import summarize
+
+
+STAGES = ['open', 'extract', 'map', 'write', 'format']
+
+# Median wall time for `python . --dry-run` on an empty folder. Short cron
+# runs pay this on every start.
+STARTUP_TARGET_SECONDS = 0.25
+STARTUP_RUNS = 7
+
+
+def compare_reports(old: Dict, new: Dict) -> str:
+    lines = [
+        f"old: {old['meta'].get('commit')} ({old['meta']['created']})",
+        f"new: {new['meta'].get('commit')} ({new['meta']['created']})",
+        '',
+        f"{'size':>6} {'stage':<10}{'old p50 ms':>12}{'new p50 ms':>12}{'change':>9}",
+    ]
+    old_runs = {run['size']: run for run in old['runs']}
+    for run in new['runs']:
+        previous = old_runs.get(run['size'])
+        if previous is None:
+            continue
+        for stage in STAGES + ['files/sec']:
+            if stage == 'files/sec':
+                before, after = previous['files_per_second'], run['files_per_second']
+                scale = 1
+            elif stage in previous['stages'] and stage in run['stages']:
+                before = previous['stages'][stage]['p50']
+                after = run['stages'][stage]['p50']
+                scale = 1000
+            else:
+                continue
+            change = f"{(after - before) / before * 100:+.1f}%" if before else 'n/a'
+            lines.append(
+                f"{run['size']:>6} {stage:<10}{before * scale:>12.2f}{after * scale:>12.2f}{change:>9}")
+    return '\n'.join(lines)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def measure_file(pdf_path: str, excel_path: str, settings) -> Dict[str, float]:
+    from core.process import pdf_to_excel
+
+    timings: Dict[str, float] = {}
+    if not pdf_to_excel(pdf_path, excel_path, settings, timings):
+        raise RuntimeError(f"Benchmark conversion failed: {pdf_path}")
+    return timings
+
+
+def measure_startup(runs: int = STARTUP_RUNS) -> Dict[str, Dict[str, float]]:
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='invoice-bench-') as directory:
+        commands = {
+            'help': ['--help'],
+            'dry_run': ['--dry-run', '--headless', '--no-cache', directory],
+        }
+        for name, args in commands.items():
+            times = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                subprocess.run(
+                    [sys.executable, package_dir] + args, check=True,
+                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+                times.append(time.perf_counter() - started)
+            results[name] = summarize(times)
+    return results
+
+
+def run_size(size: int, seed: int, settings, batch: bool = False) -> Dict:
+    with tempfile.TemporaryDirectory(prefix='invoice-bench-') as directory:
+        pdf_paths = generate_corpus(os.path.join(directory, 'pdfs'), size, seed)
+        output_dir = os.path.join(directory, 'out')
+        os.makedirs(output_dir)
+
+        stage_times: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        started = time.perf_counter()
+        for pdf_path in pdf_paths:
+            excel_path = os.path.join(
+                output_dir, os.path.basename(pdf_path).replace('.pdf', '.xlsx'))
+            for stage, seconds in measure_file(pdf_path, excel_path, settings).items():
+                stage_times[stage].append(seconds)
+        elapsed = time.perf_counter() - started
+
+        result = {
+            'size': size,
+            'seconds': elapsed,
+            'files_per_second': size / elapsed if elapsed else 0.0,
+            'stages': {stage: summarize(times) for stage, times in stage_times.items()},
+        }
+
+        if batch:
+            from dataclasses import replace
+
+            from core.process import batch_convert
+
+            report_path = os.path.join(directory, 'run-report.json')
+            batch_settings = replace(
+                settings, force=True, cache_path='', report_path=report_path)
+            started = time.perf_counter()
+            batch_convert(os.path.join(directory, 'pdfs'), batch_settings)
+            elapsed = time.perf_counter() - started
+            with open(report_path, encoding='utf-8') as f:
+                run_report = json.load(f)
+            result['batch'] = {
+                'workers': batch_settings.workers,
+                'seconds': elapsed,
+                'files_per_second': size / elapsed if elapsed else 0.0,
+                'stages': run_report['stages'],
+            }
+        return result
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(
+        prog='python -m bench',
+        description="Generate a synthetic invoice corpus and time each conversion stage.")
+    arg_parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[25, 100],
+        help="corpus sizes to run (default: %(default)s)")
+    arg_parser.add_argument(
+        '--seed', type=int, default=0, help="corpus seed (default: %(default)s)")
+    arg_parser.add_argument(
+        '--extractor', choices=['pdfplumber', 'pdfminer'], default='pdfplumber')
+    arg_parser.add_argument(
+        '--batch', action='store_true',
+        help="also time a full batch_convert run over each corpus")
+    arg_parser.add_argument(
+        '--workers', type=int, help="worker processes for --batch")
+    arg_parser.add_argument(
+        '--output', help="write the JSON report to this file (default: stdout)")
+    arg_parser.add_argument(
+        '--compare', nargs=2, metavar=('OLD', 'NEW'),
+        help="compare two saved reports instead of running")
+    arg_parser.add_argument(
+        '--check-revisions', nargs='+', metavar='REV',
+        help="instead of running, map synthetic and scrambled invoice texts "
+             "with the parser of git revision OLD and of NEW (default: the "
+             "working tree) and report any difference (exit status 1)")
+    arg_parser.add_argument(
+        '--check-templates', action='store_true',
+        help="instead of running, map the same texts with and without the "
+             "layout templates in templates.json and report any difference "
+             "(exit status 1)")
+    arg_parser.add_argument(
+        '--texts', type=int, default=200,
+        help="corpus invoices for --check-revisions / --check-templates, "
+             "each also scrambled (default: %(default)s)")
+    arg_parser.add_argument(
+        '--startup', action='store_true',
+        help="measure CLI startup time against STARTUP_TARGET_SECONDS instead "
+             "of running (exit status 1 when over target)")
+    args = arg_parser.parse_args(argv)
+    if args.check_revisions and len(args.check_revisions) > 2:
+        arg_parser.error("--check-revisions takes OLD and optionally NEW")
+
+    if args.startup:
+        startup = measure_startup()
+        for name, stats in startup.items():
+            print(f"{name:>8}: p50 {stats['p50'] * 1000:.0f} ms, max {stats['max'] * 1000:.0f} ms")
+        median = startup['dry_run']['p50']
+        print(f"  target: {STARTUP_TARGET_SECONDS * 1000:.0f} ms "
+              f"({'ok' if median <= STARTUP_TARGET_SECONDS else 'over target'})")
+        return 0 if median <= STARTUP_TARGET_SECONDS else 1
+
+    if args.check_revisions:
+        from bench.equivalence import (
+            build_texts, compare_mappers, format_comparison, revision_mapper)
+
+        old, new = (args.check_revisions + [None])[:2]
+        comparison = compare_mappers(
+            build_texts(args.texts, args.seed), revision_mapper(old), revision_mapper(new))
+        print(format_comparison(f"{old} -> {new or 'working tree'}", comparison))
+        return 1 if comparison['differences'] else 0
+
+    if args.check_templates:
+        from bench.equivalence import (
+            build_texts, compare_mappers, count_identified, format_comparison,
+            template_mappers)
+
+        templates_path = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates.json')
+        texts = build_texts(args.texts, args.seed)
+        comparison = compare_mappers(texts, *template_mappers(templates_path))
+        print(format_comparison('generic -> templates', comparison))
+        print(f"{count_identified(texts, templates_path)} of {len(texts)} texts matched a template")
+        return 1 if comparison['differences'] else 0
+
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as f:
+            old = json.load(f)
+        with open(args.compare[1], encoding='utf-8') as f:
+            new = json.load(f)
+        print(compare_reports(old, new))
+        return 0
+
+    from core.settings import load_settings
+
+    settings = load_settings({
+        'extractor': args.extractor,
+        'workers': args.workers,
+        'cache_path': '',
+    })
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'created': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'extractor': args.extractor,
+            'seed': args.seed,
+        },
+        'runs': [run_size(size, args.seed, settings, args.batch) for size in args.sizes],
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        for run in report['runs']:
+            print(f"{run['size']:>6} files: {run['files_per_second']:.1f} files/sec")
+    else:
+        print(output)
+    return 0
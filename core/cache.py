@@ -0,0 +1,131 @@
+import json
+import os
+import sqlite3
+import time
+
+from typing import Dict, List, Optional, Tuple
+
+from core.logger import dir_check
+from core.logger import zlog as log
+
+
+# Eviction keeps the store below this fraction of its limit so it does not
+# run again on the very next insert.
+EVICTION_TARGET = 0.9
+# Total size is re-checked every this many inserts per process.
+EVICTION_CHECK_INTERVAL = 50
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS extractions (
+    sha256 TEXT NOT NULL,
+    extractor TEXT NOT NULL,
+    text TEXT NOT NULL,
+    words TEXT,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (sha256, extractor)
+);
+CREATE INDEX IF NOT EXISTS extractions_accessed_at ON extractions (accessed_at);
+'''
+
+# One connection per (process, cache file); sqlite3 connections must not be
+# shared across a fork.
+_connections: Dict[Tuple[int, str], sqlite3.Connection] = {}
+_inserts_since_check: Dict[str, int] = {}
+
+
+def cache_get(cache_path: str, sha256: str, extractor: str) -> Optional[str]:
+    try:
+        connection = get_connection(cache_path)
+        row = connection.execute(
+            "SELECT text FROM extractions WHERE sha256 = ? AND extractor = ?",
+            (sha256, extractor)).fetchone()
+        if row is None:
+            return None
+        with connection:
+            connection.execute(
+                "UPDATE extractions SET accessed_at = ? WHERE sha256 = ? AND extractor = ?",
+                (time.time(), sha256, extractor))
+        return row[0]
+    except Exception as e:
+        error = f"Error reading extraction cache {cache_path}: {e}"
+        log(error, "WARNING")
+        return None
+
+
+def cache_get_words(cache_path: str, sha256: str, extractor: str) -> Optional[List[Dict]]:
+    try:
+        row = get_connection(cache_path).execute(
+            "SELECT words FROM extractions WHERE sha256 = ? AND extractor = ?",
+            (sha256, extractor)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+    except Exception as e:
+        error = f"Error reading word boxes from extraction cache {cache_path}: {e}"
+        log(error, "WARNING")
+        return None
+
+
+def cache_put(
+        cache_path: str, sha256: str, extractor: str, text: str,
+        max_bytes: int, words: Optional[List[Dict]] = None) -> bool:
+    try:
+        connection = get_connection(cache_path)
+        words_json = json.dumps(words) if words is not None else None
+        size = len(text.encode('utf-8')) + len(words_json or '')
+        now = time.time()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO extractions "
+                "(sha256, extractor, text, words, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (sha256, extractor, text, words_json, size, now, now))
+
+        inserts = _inserts_since_check.get(cache_path, 0) + 1
+        _inserts_since_check[cache_path] = inserts
+        if inserts >= EVICTION_CHECK_INTERVAL:
+            _inserts_since_check[cache_path] = 0
+            evict(connection, max_bytes)
+        return True
+    except Exception as e:
+        error = f"Error writing extraction cache {cache_path}: {e}"
+        log(error, "WARNING")
+        return False
+
+
+def evict(connection: sqlite3.Connection, max_bytes: int) -> int:
+    total = connection.execute(
+        "SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+    if total <= max_bytes:
+        return 0
+
+    target = int(max_bytes * EVICTION_TARGET)
+    evicted = 0
+    keys = []
+    for sha256, extractor, size in connection.execute(
+            "SELECT sha256, extractor, size FROM extractions ORDER BY accessed_at"):
+        if total <= target:
+            break
+        keys.append((sha256, extractor))
+        total -= size
+        evicted += 1
+    with connection:
+        connection.executemany(
+            "DELETE FROM extractions WHERE sha256 = ? AND extractor = ?", keys)
+    log(f"Evicted {evicted} entries from the extraction cache", "INFO", True)
+    return evicted
+
+
+def get_connection(cache_path: str) -> sqlite3.Connection:
+    key = (os.getpid(), cache_path)
+    connection = _connections.get(key)
+    if connection is None:
+        dir_check(os.path.dirname(os.path.abspath(cache_path)))
+        connection = sqlite3.connect(cache_path, timeout=30.0)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        _connections[key] = connection
+    return connection
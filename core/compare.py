@@ -0,0 +1,117 @@
+import json
+import os
+import time
+import tracemalloc
+
+from typing import Dict, List, Optional, Sequence
+
+from core.extract import Extractor, get_extractor
+from core.logger import zlog as log
+from core.process import map_text_to_columns
+from core.settings import Settings
+
+
+def compare_extractors(
+        pdf_paths: Sequence[str], names: Sequence[str], settings: Settings,
+        report_path: Optional[str] = None) -> Dict:
+    extractors = [get_extractor(name) for name in names]
+    totals = {
+        name: {'seconds': 0.0, 'max_peak_bytes': 0, 'errors': 0}
+        for name in names}
+    files = []
+    matches = 0
+
+    for pdf_path in pdf_paths:
+        entry = {'file': pdf_path, 'extractors': {}}
+        mapped = []
+        for extractor in extractors:
+            result = measure_extractor(extractor, pdf_path)
+            text = result.pop('text')
+            mapped.append(
+                None if text is None else map_text_to_columns(text, settings))
+            entry['extractors'][extractor.name] = result
+
+            total = totals[extractor.name]
+            total['seconds'] += result['seconds']
+            total['max_peak_bytes'] = max(
+                total['max_peak_bytes'], result['peak_bytes'])
+            if result['error'] is not None:
+                total['errors'] += 1
+
+        entry['mapping_matches'] = mapped[0] is not None and all(
+            other == mapped[0] for other in mapped[1:])
+        if entry['mapping_matches']:
+            matches += 1
+        else:
+            entry['differences'] = mapping_differences(mapped, names)
+        files.append(entry)
+
+    report = {
+        'extractors': list(names),
+        'file_count': len(files),
+        'matching_files': matches,
+        'totals': totals,
+        'files': files,
+    }
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def format_comparison(report: Dict) -> str:
+    names = report['extractors']
+    lines = [f"{'file':<40}" + ''.join(
+        f"{name + ' ms':>16}{name + ' KiB':>16}" for name in names) + f"{'match':>8}"]
+    for entry in report['files']:
+        row = f"{os.path.basename(entry['file'])[:40]:<40}"
+        for name in names:
+            result = entry['extractors'][name]
+            row += f"{result['seconds'] * 1000:>16.1f}{result['peak_bytes'] / 1024:>16.0f}"
+        row += f"{'yes' if entry['mapping_matches'] else 'NO':>8}"
+        lines.append(row)
+    lines.append('')
+    for name in names:
+        total = report['totals'][name]
+        lines.append(
+            f"{name}: {total['seconds']:.2f}s total, "
+            f"{total['max_peak_bytes'] / 1024:.0f} KiB max peak, "
+            f"{total['errors']} error(s)")
+    lines.append(
+        f"Mapping output matches for {report['matching_files']} of "
+        f"{report['file_count']} file(s)")
+    return '\n'.join(lines)
+
+
+def mapping_differences(mapped: List[Optional[Dict]], names: Sequence[str]) -> Dict:
+    differences = {}
+    keys = set()
+    for data in mapped:
+        keys.update(data or {})
+    for key in sorted(keys):
+        values = [None if data is None else data.get(key) for data in mapped]
+        if any(value != values[0] for value in values[1:]):
+            differences[key] = dict(zip(names, [str(value) for value in values]))
+    return differences
+
+
+def measure_extractor(extractor: Extractor, pdf_path: str) -> Dict:
+    # Timed and memory-profiled in separate runs: tracemalloc slows
+    # allocation-heavy code down enough to distort the timing.
+    result = {'seconds': 0.0, 'peak_bytes': 0, 'error': None, 'text': None}
+    try:
+        started = time.perf_counter()
+        result['text'] = extractor.extract_text(pdf_path)
+        result['seconds'] = time.perf_counter() - started
+
+        tracemalloc.start()
+        try:
+            extractor.extract_text(pdf_path)
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    except Exception as e:
+        result['error'] = str(e)
+        error = f"Extractor {extractor.name} failed on {os.path.basename(pdf_path)}: {e}"
+        log(error, "WARNING")
+    return result
@@ -0,0 +1,180 @@
+import os
+
+from typing import Dict, Optional, Tuple
+
+from core.filer import file_sha256, load_json, save_json
+from core.record import Invoice
+
+
+DEDUP_INDEX_NAME = 'dedup-index.json'
+
+KIND_IDENTICAL = 'identical'
+KIND_INVOICE = 'invoice'
+
+
+class DedupIndex:
+    # Persistent index of the PDFs converted under a target folder, keyed by
+    # content hash and by (Invoice, Purchase Order). A key belongs to the
+    # first file converted with it; a copy elsewhere in the tree is a
+    # duplicate for as long as that file still exists. Paths are relative to
+    # target_dir. Checks run on the mapping thread; the caller releases
+    # failed files and saves once the pipeline has finished.
+
+    def __init__(self, target_dir: str, index_path: str, data: Dict):
+        self.target_dir = target_dir
+        self.index_path = index_path
+        self.files: Dict[str, Dict] = data.get('files', {})
+        self.duplicates: Dict[str, Dict] = data.get('duplicates', {})
+        self.hashes: Dict[str, str] = {}
+        self.invoices: Dict[str, str] = {}
+        for pdf_file, keys in self.files.items():
+            if keys.get('sha256'):
+                self.hashes.setdefault(keys['sha256'], pdf_file)
+            if keys.get('invoice'):
+                self.invoices.setdefault(keys['invoice'], pdf_file)
+        # Duplicates found in this run, flagged or skipped: file -> (kind, original).
+        self.found: Dict[str, Tuple[str, str]] = {}
+        self.dirty = False
+
+    def check_file(
+            self, pdf_path: str,
+            recheck: bool = False) -> Tuple[Optional[str], Optional[str]]:
+        # Before extraction: returns (original, sha256), where original is the
+        # file this PDF is a byte-identical copy of. Otherwise the PDF becomes
+        # the owner of its content hash. Known copies that have not changed
+        # are not hashed again unless recheck is set (sha256 is None then).
+        pdf_file = self.relative(pdf_path)
+        if not recheck and self.is_known_duplicate(pdf_file, pdf_path):
+            entry = self.duplicates[pdf_file]
+            self.found[pdf_file] = (entry['kind'], entry['of'])
+            return entry['of'], None
+        sha256 = file_sha256(pdf_path)
+        if sha256 is None:
+            return None, None
+        owner = self.hashes.get(sha256)
+        if owner is not None and owner != pdf_file and self.is_stale(owner):
+            # The owner changed since it was hashed and may no longer hold
+            # this content: hash it again before comparing with it.
+            self.check_file(os.path.join(self.target_dir, owner), recheck=True)
+        original = self.claim(self.hashes, 'sha256', sha256, pdf_file)
+        if original is not None:
+            self.record_duplicate(pdf_file, pdf_path, KIND_IDENTICAL, original)
+            return original, sha256
+        signature = get_signature(pdf_path)
+        if signature is not None:
+            self.files[pdf_file]['size'], self.files[pdf_file]['mtime_ns'] = signature
+        if self.duplicates.pop(pdf_file, None) is not None:
+            self.dirty = True
+        return None, sha256
+
+    def check_invoice(self, pdf_path: str, invoice: Invoice, skip: bool) -> Optional[str]:
+        # After parsing: returns the file that already holds this invoice
+        # number and purchase order, or makes this PDF its owner. Skipped
+        # duplicates are remembered so later runs skip them without hashing.
+        key = get_invoice_key(invoice)
+        if key is None:
+            return None
+        pdf_file = self.relative(pdf_path)
+        original = self.claim(self.invoices, 'invoice', key, pdf_file)
+        if original is None:
+            return None
+        if skip:
+            self.record_duplicate(pdf_file, pdf_path, KIND_INVOICE, original)
+        else:
+            self.found[pdf_file] = (KIND_INVOICE, original)
+        return original
+
+    def claim(self, owners: Dict[str, str], field: str, key: str, pdf_file: str) -> Optional[str]:
+        owner = owners.get(key)
+        if owner is not None and owner != pdf_file and os.path.exists(
+                os.path.join(self.target_dir, owner)):
+            return owner
+        keys = self.files.setdefault(pdf_file, {'sha256': None, 'invoice': None})
+        if keys[field] != key:
+            # The file changed: its old key no longer belongs to it.
+            if keys[field] is not None and owners.get(keys[field]) == pdf_file:
+                del owners[keys[field]]
+            keys[field] = key
+        owners[key] = pdf_file
+        self.dirty = True
+        return None
+
+    def duplicate_of(self, pdf_path: str) -> Optional[Tuple[str, str]]:
+        return self.found.get(self.relative(pdf_path))
+
+    def is_known_duplicate(self, pdf_file: str, pdf_path: str) -> bool:
+        # Trusted only while neither the copy nor its original changed: the
+        # copy has the same size and mtime, and the original still has the
+        # content hash it had when the copy was found. Otherwise the copy is
+        # hashed and checked again.
+        entry = self.duplicates.get(pdf_file)
+        if entry is None:
+            return False
+        keys = self.files.get(entry['of'])
+        if (keys is None or keys.get('sha256') is None or
+                keys['sha256'] != entry.get('of_sha256') or self.is_stale(entry['of'])):
+            return False
+        return get_signature(pdf_path) == (entry['size'], entry['mtime_ns'])
+
+    def is_stale(self, pdf_file: str) -> bool:
+        # True when a hashed file changed (or disappeared) since it was hashed.
+        keys = self.files.get(pdf_file, {})
+        return get_signature(os.path.join(self.target_dir, pdf_file)) != (
+            keys.get('size'), keys.get('mtime_ns'))
+
+    def record_duplicate(self, pdf_file: str, pdf_path: str, kind: str, original: str) -> None:
+        self.found[pdf_file] = (kind, original)
+        signature = get_signature(pdf_path)
+        if signature is None:
+            return
+        self.duplicates[pdf_file] = {
+            'kind': kind,
+            'of': original,
+            'of_sha256': self.files.get(original, {}).get('sha256'),
+            'size': signature[0],
+            'mtime_ns': signature[1],
+        }
+        self.dirty = True
+
+    def relative(self, pdf_path: str) -> str:
+        return os.path.relpath(pdf_path, self.target_dir)
+
+    def release(self, pdf_path: str) -> None:
+        # A file that failed to convert gives up its keys, so the next copy
+        # is converted instead of being skipped as its duplicate.
+        pdf_file = self.relative(pdf_path)
+        keys = self.files.pop(pdf_file, None)
+        if keys is None:
+            return
+        for owners, key in ((self.hashes, keys.get('sha256')), (self.invoices, keys.get('invoice'))):
+            if key is not None and owners.get(key) == pdf_file:
+                del owners[key]
+        self.dirty = True
+
+    def save(self) -> bool:
+        if not self.dirty:
+            return True
+        data = {'files': self.files, 'duplicates': self.duplicates}
+        if not save_json(self.index_path, data, 'dedup index'):
+            return False
+        self.dirty = False
+        return True
+
+
+def get_invoice_key(invoice: Invoice) -> Optional[str]:
+    # Invoices without a number are never treated as duplicates.
+    if not invoice.invoice:
+        return None
+    return f"{invoice.invoice.strip()}|{(invoice.purchase_order or '').strip()}"
+
+
+def get_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def load_dedup_index(target_dir: str, index_path: str) -> DedupIndex:
+    return DedupIndex(target_dir, index_path, load_json(index_path, 'dedup index') or {})
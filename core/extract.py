@@ -0,0 +1,159 @@
+import pdfminer
+import pdfplumber
+import time
+
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LTChar, LTContainer
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from typing import Dict, Iterator, List, Optional, Type
+
+from core.logger import zlog as log
+
+
+# Same defaults pdfplumber uses for extract_text().
+X_TOLERANCE = 3
+Y_TOLERANCE = 3
+
+
+class Extractor:
+    name = ''
+
+    def key(self) -> str:
+        raise NotImplementedError
+
+    def iter_page_text(
+            self, pdf_path: str,
+            timings: Optional[Dict[str, float]] = None) -> Iterator[str]:
+        # Implementations record how long opening the document took under
+        # timings['open'] when a timings dict is passed.
+        raise NotImplementedError
+
+    def extract_text(
+            self, pdf_path: str, timings: Optional[Dict[str, float]] = None) -> str:
+        # The pages a conversion reads: up to the one that ends the product
+        # table.
+        from core.process import read_invoice_pages
+
+        pages = self.iter_page_text(pdf_path, timings)
+        try:
+            return read_invoice_pages(pages)
+        finally:
+            pages.close()
+
+    def extract_words(
+            self, pdf_path: str, page_count: Optional[int] = None) -> Optional[List[Dict]]:
+        return None
+
+
+class PdfplumberExtractor(Extractor):
+    name = 'pdfplumber'
+
+    def key(self) -> str:
+        return f"pdfplumber-{pdfplumber.__version__}:extract_text"
+
+    def iter_page_text(
+            self, pdf_path: str,
+            timings: Optional[Dict[str, float]] = None) -> Iterator[str]:
+        started = time.perf_counter()
+        with pdfplumber.open(pdf_path) as pdf:
+            if timings is not None:
+                timings['open'] = time.perf_counter() - started
+            for page in pdf.pages:
+                yield page.extract_text()
+                page.close()
+
+    def extract_words(
+            self, pdf_path: str, page_count: Optional[int] = None) -> Optional[List[Dict]]:
+        # Words of the first page_count pages (all when None), tagged with
+        # their page number since positions restart on every page.
+        words = []
+        with pdfplumber.open(pdf_path) as pdf:
+            for page in pdf.pages[:page_count]:
+                for word in page.extract_words():
+                    word['page_number'] = page.page_number
+                    words.append(word)
+                page.close()
+        return words
+
+
+class PdfminerExtractor(Extractor):
+    # Runs pdfminer's interpreter without layout analysis and rebuilds lines
+    # from the raw characters, skipping the char/rect/curve objects pdfplumber
+    # builds for every page.
+    name = 'pdfminer'
+
+    def key(self) -> str:
+        return f"pdfminer-{pdfminer.__version__}:chars"
+
+    def iter_page_text(
+            self, pdf_path: str,
+            timings: Optional[Dict[str, float]] = None) -> Iterator[str]:
+        started = time.perf_counter()
+        resource_manager = PDFResourceManager(caching=True)
+        device = PDFPageAggregator(resource_manager, laparams=None)
+        interpreter = PDFPageInterpreter(resource_manager, device)
+        with open(pdf_path, 'rb') as f:
+            document = PDFDocument(PDFParser(f))
+            if timings is not None:
+                timings['open'] = time.perf_counter() - started
+            for page in PDFPage.create_pages(document):
+                interpreter.process_page(page)
+                layout = device.get_result()
+                yield chars_to_text(collect_chars(layout), layout.height)
+
+
+EXTRACTORS: Dict[str, Type[Extractor]] = {
+    PdfplumberExtractor.name: PdfplumberExtractor,
+    PdfminerExtractor.name: PdfminerExtractor,
+}
+
+
+def chars_to_text(chars: List[LTChar], page_height: float) -> str:
+    # Cluster characters into lines by their top edge, then order each line by
+    # x and insert a space wherever the gap is wider than X_TOLERANCE.
+    if not chars:
+        return ''
+    chars = sorted(chars, key=lambda char: (page_height - char.y1, char.x0))
+    lines: List[List[LTChar]] = []
+    line_top = None
+    for char in chars:
+        top = page_height - char.y1
+        if line_top is None or top - line_top > Y_TOLERANCE:
+            lines.append([])
+            line_top = top
+        lines[-1].append(char)
+
+    text_lines = []
+    for line in lines:
+        line.sort(key=lambda char: char.x0)
+        parts = []
+        previous = None
+        for char in line:
+            if previous is not None and char.x0 > previous.x1 + X_TOLERANCE:
+                parts.append(' ')
+            parts.append(char.get_text())
+            previous = char
+        text_lines.append(' '.join(''.join(parts).split()))
+    return '\n'.join(line for line in text_lines if line)
+
+
+def collect_chars(container: LTContainer) -> List[LTChar]:
+    chars = []
+    for item in container:
+        if isinstance(item, LTChar):
+            chars.append(item)
+        elif isinstance(item, LTContainer):
+            chars.extend(collect_chars(item))
+    return chars
+
+
+def get_extractor(name: str) -> Extractor:
+    try:
+        return EXTRACTORS[name]()
+    except KeyError:
+        error = f"Unknown extractor '{name}', expected one of {', '.join(EXTRACTORS)}"
+        log(error, "FATAL")
+        raise ValueError(error)
@@ -1,13 +1,14 @@
+import hashlib
+import json
 import os
 import platform
-import tkinter as tk
 
 
-from tkinter import filedialog
-from typing import Optional, Union, Tuple
+from typing import Dict, Optional, Union, Tuple
 
 
 from core.logger import zlog as log
+from core.writer import atomic_output
 
 
 Detailed_Result = Tuple[
@@ -18,8 +19,27 @@ Detailed_Result = Tuple[
 ]
 
 
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> Optional[str]:
+    try:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    except Exception as e:
+        error_message = f"Failed to hash {path}. Exception: {e}"
+        log(error_message, "WARNING")
+        return None
+
+
 def is_gui_available():
+    # Without a display there is no point loading tkinter at all.
+    if platform.system() == 'Linux' and not (
+            os.getenv('DISPLAY') or os.getenv('WAYLAND_DISPLAY')):
+        return False
     try:
+        import tkinter as tk
+
         root = tk.Tk()
         root.withdraw()
         return True
@@ -27,6 +47,22 @@ def is_gui_available():
         return False
 
 
+def load_json(path: str, description: str) -> Optional[Dict]:
+    # None when the file does not exist or cannot be read.
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError("not a JSON object")
+        return data
+    except Exception as e:
+        error = f"Error loading {description} {path}: {e}"
+        log(error, "WARNING")
+        return None
+
+
 def path_to_module(path: str) -> str:
     try:
         relative_path = os.path.relpath(path, os.getcwd())
@@ -42,11 +78,30 @@ def path_to_module(path: str) -> str:
         return path
 
 
+def save_json(path: str, data: Dict, description: str) -> bool:
+    # Written to a temporary file and renamed over path, so readers never see
+    # a half-written file and a failed write leaves nothing behind.
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with atomic_output(path) as temp_path:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+        return True
+    except Exception as e:
+        error = f"Error saving {description} {path}: {e}"
+        log(error, "WARNING")
+        return False
+
+
 def select_folder(title: str = "Select a folder to process"):
     current_working_directory = os.getcwd()
     os_type = platform.system()
 
     if os_type in ['Windows', 'Darwin'] or (os_type == 'Linux' and is_gui_available()):
+        import tkinter as tk
+
+        from tkinter import filedialog
+
         root = tk.Tk()
         root.withdraw()
         folder_selected = filedialog.askdirectory(
@@ -0,0 +1,250 @@
+import multiprocessing
+import os
+import signal
+import time
+
+from multiprocessing.connection import Connection, wait
+from typing import Any, Callable, Iterable, Iterator, List, NamedTuple, Optional
+
+from core.logger import zlog as log
+from core.settings import Settings
+from core.timing import Stage_Timings
+
+
+# How often a waiting pool wakes up to check deadlines and memory.
+TICK_SECONDS = 0.25
+
+OUTCOME_DONE = 'done'
+OUTCOME_TIMED_OUT = 'timed_out'
+OUTCOME_OVER_MEMORY = 'over_memory'
+OUTCOME_CRASHED = 'crashed'
+
+
+class IsolatedResult(NamedTuple):
+    job: Any
+    tag: Any
+    outcome: str
+    # The job function's return value; None unless outcome is OUTCOME_DONE.
+    result: Any
+    # Stages the file finished before it was stopped.
+    timings: Stage_Timings
+    seconds: float
+
+
+class StageReporter(dict):
+    # Timings dict that also sends every recorded stage to the parent, so a
+    # file that is killed mid-way still shows the stage it was stuck in.
+
+    def __init__(self, conn: Connection):
+        super().__init__()
+        self.conn = conn
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+    def __setitem__(self, stage: str, seconds: float) -> None:
+        super().__setitem__(stage, seconds)
+        self.conn.send(('stage', stage, seconds))
+
+
+class Worker:
+
+    def __init__(self, process: multiprocessing.Process, conn: Connection):
+        self.process = process
+        self.conn = conn
+        self.files = 0
+        self.job: Any = None
+        self.tag: Any = None
+        self.started = 0.0
+        self.timings: Stage_Timings = {}
+
+
+class WorkerPool:
+    # Runs one job at a time per worker process, so each file can be held to
+    # settings.file_timeout seconds and settings.file_memory_mb of resident
+    # memory. A worker over budget is killed and replaced; the batch goes on.
+    # Workers are also replaced after settings.worker_max_files files, which
+    # caps what the PDF libraries cache between files.
+
+    def __init__(self, job_function: Callable, settings: Settings):
+        self.job_function = job_function
+        self.settings = settings
+        self.context = get_context()
+        self.workers: List[Worker] = []
+        self.memory_checked = True
+
+    def busy(self) -> List[Worker]:
+        return [worker for worker in self.workers if worker.job is not None]
+
+    def close(self) -> None:
+        # Idle workers exit on their own; busy ones are killed.
+        for worker in list(self.workers):
+            if worker.job is None:
+                self.retire(worker)
+            else:
+                self.kill(worker)
+
+    def collect(self) -> List[IsolatedResult]:
+        # Waits up to TICK_SECONDS for the running jobs and returns those that
+        # finished or were stopped meanwhile (possibly none).
+        busy = self.busy()
+        if not busy:
+            return []
+        finished: List[IsolatedResult] = []
+        ready = wait([worker.conn for worker in busy], timeout=TICK_SECONDS)
+        for worker in busy:
+            if worker.conn not in ready:
+                continue
+            # Drain the stage messages queued ahead of the result.
+            while True:
+                result = self.receive(worker)
+                if result is not None:
+                    finished.append(result)
+                    break
+                if not worker.conn.poll():
+                    break
+        finished.extend(self.enforce_budgets())
+        return finished
+
+    def enforce_budgets(self) -> List[IsolatedResult]:
+        stopped = []
+        now = time.monotonic()
+        for worker in self.busy():
+            outcome = None
+            if self.settings.file_timeout and now - worker.started > self.settings.file_timeout:
+                outcome = OUTCOME_TIMED_OUT
+            elif self.settings.file_memory_mb:
+                resident_mb = get_resident_mb(worker.process.pid)
+                if resident_mb is None and self.memory_checked:
+                    self.memory_checked = False
+                    log("Cannot read worker memory here, FILE_MEMORY_MB is not enforced", "WARNING")
+                elif resident_mb is not None and resident_mb > self.settings.file_memory_mb:
+                    outcome = OUTCOME_OVER_MEMORY
+            if outcome is not None:
+                stopped.append(self.finish(worker, outcome, None))
+                self.kill(worker)
+        return stopped
+
+    def finish(self, worker: Worker, outcome: str, result: Any) -> IsolatedResult:
+        finished = IsolatedResult(
+            worker.job, worker.tag, outcome, result, worker.timings,
+            time.monotonic() - worker.started)
+        worker.job = worker.tag = None
+        worker.timings = {}
+        return finished
+
+    def has_capacity(self) -> bool:
+        return len(self.busy()) < self.settings.workers
+
+    def kill(self, worker: Worker) -> None:
+        worker.process.kill()
+        worker.process.join()
+        worker.conn.close()
+        self.workers.remove(worker)
+
+    def receive(self, worker: Worker) -> Optional[IsolatedResult]:
+        try:
+            message = worker.conn.recv()
+        except (EOFError, OSError):
+            # Died without answering: killed by the OS (OOM) or crashed in C.
+            finished = self.finish(worker, OUTCOME_CRASHED, None)
+            self.kill(worker)
+            return finished
+        if message[0] == 'stage':
+            _, stage, seconds = message
+            worker.timings[stage] = seconds
+            return None
+        if message[0] == 'error':
+            log(f"Error in worker {worker.process.pid}: {message[1]}", "ERROR")
+            finished = self.finish(worker, OUTCOME_CRASHED, None)
+        else:
+            finished = self.finish(worker, OUTCOME_DONE, message[1])
+        worker.files += 1
+        if worker.files >= self.settings.worker_max_files:
+            self.retire(worker)
+        return finished
+
+    def retire(self, worker: Worker) -> None:
+        try:
+            worker.conn.send(None)
+        except OSError:
+            pass
+        worker.process.join()
+        worker.conn.close()
+        self.workers.remove(worker)
+
+    def start_worker(self) -> Worker:
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(
+            target=worker_main, args=(child_conn, self.job_function),
+            name='invoice-worker', daemon=True)
+        process.start()
+        child_conn.close()
+        worker = Worker(process, parent_conn)
+        self.workers.append(worker)
+        return worker
+
+    def submit(self, job: Any, tag: Any = None) -> None:
+        # Callers check has_capacity() first.
+        idle = [worker for worker in self.workers if worker.job is None]
+        worker = idle[0] if idle else self.start_worker()
+        worker.job, worker.tag = job, tag
+        worker.started = time.monotonic()
+        worker.conn.send(job)
+
+
+def get_context() -> multiprocessing.context.BaseContext:
+    # Workers are started while the pipeline threads are running, and fork
+    # would copy whatever locks those threads hold. The forkserver is a fresh
+    # single-threaded process that preloads the parser, so workers forked from
+    # it still start quickly.
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(['core.process'])
+    return context
+
+
+def get_resident_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f'/proc/{pid}/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def has_budget(settings: Settings) -> bool:
+    return bool(settings.file_timeout or settings.file_memory_mb)
+
+
+def iter_isolated(
+        job_function: Callable, jobs: Iterable, settings: Settings) -> Iterator[IsolatedResult]:
+    # Runs every job in a WorkerPool and yields the results as they finish.
+    pool = WorkerPool(job_function, settings)
+    try:
+        for job in jobs:
+            while not pool.has_capacity():
+                yield from pool.collect()
+            pool.submit(job)
+        while pool.busy():
+            yield from pool.collect()
+    finally:
+        pool.close()
+
+
+def worker_main(conn: Connection, job_function: Callable) -> None:
+    # Ctrl+C is handled by the parent, which kills busy workers itself.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        try:
+            result = job_function(job, timings=StageReporter(conn))
+            conn.send(('done', result))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
@@ -0,0 +1,92 @@
+import json
+import os
+
+from typing import IO, Dict, Optional
+
+from core.logger import zlog as log
+
+
+# Append-only record of a batch run, one JSON object per line: a 'start'
+# line, one line per finished PDF and a 'finish' line once the run ends.
+# Manifests are only saved when a run ends, so after a crash this is the
+# only record of what was already converted.
+JOURNAL_NAME = 'run-journal.jsonl'
+
+STATE_CONVERTED = 'converted'
+STATE_FAILED = 'failed'
+
+
+class Journal:
+
+    def __init__(self, journal_path: str, handle: IO[str]):
+        self.journal_path = journal_path
+        self.handle = handle
+
+    def close(self) -> None:
+        self.handle.close()
+
+    def finish(self) -> None:
+        self.write({'event': 'finish'})
+
+    def record(self, pdf_file: str, state: str, entry: Optional[Dict] = None) -> None:
+        line = {'file': pdf_file, 'state': state}
+        if entry is not None:
+            line['entry'] = entry
+        self.write(line)
+
+    def write(self, line: Dict) -> None:
+        # Flushed per line: a killed process loses at most the line being
+        # written, which load_journal skips.
+        try:
+            self.handle.write(json.dumps(line) + '\n')
+            self.handle.flush()
+        except Exception as e:
+            error = f"Error writing run journal {self.journal_path}: {e}"
+            log(error, "WARNING")
+
+
+def load_journal(journal_path: str, version: str) -> Optional[Dict[str, Dict]]:
+    # Returns the manifest entries of the PDFs an unfinished run converted,
+    # keyed by path relative to the target folder, or None when there is
+    # nothing to resume (no journal, a finished run or another parser version).
+    if not os.path.exists(journal_path):
+        return None
+    converted: Dict[str, Dict] = {}
+    finished = False
+    try:
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    continue
+                if data.get('event') == 'start':
+                    if data.get('version') != version:
+                        log(f"Run journal {journal_path} is from another parser version", "INFO")
+                        return None
+                    finished = False
+                elif data.get('event') == 'finish':
+                    finished = True
+                elif data.get('state') == STATE_CONVERTED:
+                    converted[data['file']] = data['entry']
+                elif data.get('state') == STATE_FAILED:
+                    converted.pop(data['file'], None)
+    except Exception as e:
+        error = f"Error loading run journal {journal_path}: {e}"
+        log(error, "WARNING")
+        return None
+    return None if finished else converted
+
+
+def open_journal(journal_path: str, version: str, append: bool = False) -> Optional[Journal]:
+    # A new run truncates the journal; a resumed run appends to it.
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(journal_path)), exist_ok=True)
+        handle = open(journal_path, 'a' if append else 'w', encoding='utf-8')
+        journal = Journal(journal_path, handle)
+        journal.write({'event': 'start', 'version': version})
+        return journal
+    except Exception as e:
+        error = f"Error opening run journal {journal_path}: {e}"
+        log(error, "WARNING")
+        return None
@@ -1,9 +1,20 @@
+import atexit
 import datetime
+import json
 import os
+import queue
+import sys
+import threading
+import time
 
 from datetime import datetime
 from dotenv import load_dotenv
-from typing import Optional, Union, Tuple
+from typing import List, Optional, Union, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 load_dotenv()
@@ -16,6 +27,32 @@ Detailed_Result = Tuple[
     ],
 ]
 
+Log_Record = Tuple[str, str, bool, bool]
+
+# Records queued for the background writer: timestamp, level, success,
+# message, console.
+Queued_Record = Tuple[str, str, bool, str, bool]
+
+FLUSH_INTERVAL = 0.25
+MAX_BATCH = 500
+
+
+# When a list is installed here (by worker processes), zlog collects records
+# instead of writing them so the parent process can replay them in order.
+_captured_logs: Optional[List[Log_Record]] = None
+
+# Background writer state. _writer_pid detects forked children, which inherit
+# the queue object but not the thread that drains it.
+_log_queue: Optional[queue.Queue] = None
+_writer_thread: Optional[threading.Thread] = None
+_writer_pid: Optional[int] = None
+_writer_lock = threading.Lock()
+
+
+def capture_logs() -> None:
+    global _captured_logs
+    _captured_logs = []
+
 
 def check_function(
     path: str, create_dir: bool = False, is_directory: bool = True
@@ -26,7 +63,7 @@ def check_function(
         else:
             if is_directory:
                 if create_dir:
-                    os.makedirs(path)
+                    os.makedirs(path, exist_ok=True)
                     return True, None
                 else:
                     raise Exception(f"{path} does not exist")
@@ -45,6 +82,11 @@ def dir_check(dir_path: str, create_dir: bool = True) -> Detailed_Result:
     return check_function(dir_path, create_dir, is_directory=True)
 
 
+def enqueue(record: Queued_Record) -> None:
+    start_writer()
+    _log_queue.put(record)
+
+
 def fix_datetime(
     input_time: datetime, milliseconds: bool = False
 ) -> Optional[str]:
@@ -65,43 +107,157 @@ def fix_datetime(
         return None
 
 
+def flush_logs(timeout: float = 5.0) -> None:
+    if _log_queue is None or _writer_pid != os.getpid():
+        return
+    deadline = time.monotonic() + timeout
+    while _log_queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
 def format_log_date(date_to_format) -> str:
     return date_to_format.replace("-", "")
 
 
-def log(error_message: str, level: Optional[str] = "CRITICAL", success: bool = False) -> None:
-    log_dir = f'../{os.getenv("LOG_DIR", "logs")}'
+def format_record(record: Queued_Record, json_lines: bool) -> str:
+    timestamp, level, success, message, _ = record
+    if json_lines:
+        return json.dumps({
+            "time": timestamp,
+            "level": level,
+            "success": success,
+            "message": message,
+            "pid": os.getpid(),
+        }) + "\n"
+    if success:
+        return f"[{timestamp}] [{level}] Success: {message}\n"
+    return f"[{timestamp}] [{level}] Error: {message}\n"
+
+
+def get_log_dir() -> str:
     current_dir = os.path.dirname(os.path.abspath(__file__))
-    log_dir = os.path.join(current_dir, log_dir)
+    return os.path.join(current_dir, f'../{os.getenv("LOG_DIR", "logs")}')
+
+
+def log(error_message: str, level: Optional[str] = "CRITICAL", success: bool = False) -> None:
+    if _captured_logs is not None:
+        _captured_logs.append((error_message, level, success, False))
+        return
+    enqueue((now(), level, success, error_message, False))
+
+
+def now() -> Optional[str]:
+    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def open_log_file(log_dir: str, day: str, json_lines: bool) -> int:
+    # O_APPEND makes each os.write land at the end of the file even when
+    # several processes share it; O_EXCL tells us who created it.
     dir_check(log_dir)
-    log_file_stamp = format_log_date(today())
-    log_file = os.path.join(log_dir, f"{log_file_stamp}.log")
+    extension = "jsonl" if json_lines else "log"
+    log_file = os.path.join(log_dir, f"{format_log_date(day)}.{extension}")
+    try:
+        fd = os.open(log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_EXCL, 0o644)
+        if not json_lines:
+            os.write(fd, f"[{now()}] New Log File Started.\n".encode("utf-8"))
+        return fd
+    except FileExistsError:
+        return os.open(log_file, os.O_WRONLY | os.O_APPEND)
 
-    if dir_check(log_dir):
-        is_new_file = not os.path.exists(log_file)
 
-        with open(log_file, "a") as f:
-            if is_new_file:
-                f.write(f"[{now()}] New Log File Started.\n")
+def release_logs() -> List[Log_Record]:
+    global _captured_logs
+    records = _captured_logs or []
+    _captured_logs = None
+    return records
 
-            if success:
-                f.write(f"[{now()}] [{level}] Success: {error_message}\n")
-            else:
-                f.write(f"[{now()}] [{level}] Error: {error_message}\n")
 
+def replay_logs(records: List[Log_Record]) -> None:
+    for message, level, success, console in records:
+        zlog(message, level, success, console)
+
+
+def start_writer() -> None:
+    global _log_queue, _writer_thread, _writer_pid
+    if _writer_pid == os.getpid():
+        return
+    with _writer_lock:
+        if _writer_pid == os.getpid():
+            return
+        _log_queue = queue.Queue()
+        _writer_thread = threading.Thread(
+            target=write_logs, args=(_log_queue,), name="log-writer", daemon=True)
+        _writer_thread.start()
+        _writer_pid = os.getpid()
 
-def now() -> Optional[str]:
-    return fix_datetime(datetime.utcnow(), milliseconds=True)
+
+def stop_writer() -> None:
+    if _log_queue is None or _writer_pid != os.getpid():
+        return
+    _log_queue.put(None)
+    _writer_thread.join(timeout=5.0)
 
 
 def today() -> Optional[str]:
-    formatted_date = fix_datetime(datetime.utcnow())
-    if formatted_date is None:
-        error_message = "Failed to retrieve current date. Return is None."
-        zlog(error_message, "ERROR")
-        return None
-    else:
-        return formatted_date.split(" ")[0]
+    return datetime.utcnow().strftime("%Y-%m-%d")
+
+
+def write_batch(fd: int, batch: List[Queued_Record], json_lines: bool) -> None:
+    data = "".join(format_record(record, json_lines) for record in batch)
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        os.write(fd, data.encode("utf-8"))
+    finally:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def write_logs(log_queue: queue.Queue) -> None:
+    # One long-lived handle per day; records are drained in batches so a
+    # busy run costs one write per batch instead of an open/append/close per
+    # message.
+    json_lines = os.getenv("LOG_FORMAT", "text").lower() in ("json", "jsonl")
+    log_dir = get_log_dir()
+    fd, fd_day = None, None
+    running = True
+
+    while running:
+        record = log_queue.get()
+        batch = [] if record is None else [record]
+        running = record is not None
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while running and len(batch) < MAX_BATCH:
+            try:
+                record = log_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if record is None:
+                running = False
+            else:
+                batch.append(record)
+
+        try:
+            console = [record[3] for record in batch if record[4]]
+            if console:
+                sys.stdout.write("\n".join(console) + "\n")
+                sys.stdout.flush()
+
+            if batch:
+                day = today()
+                if fd is None or day != fd_day:
+                    if fd is not None:
+                        os.close(fd)
+                    fd, fd_day = open_log_file(log_dir, day, json_lines), day
+                write_batch(fd, batch, json_lines)
+        except Exception as e:
+            sys.stderr.write(f"Failed to write {len(batch)} log record(s): {e}\n")
+        finally:
+            for _ in range(len(batch) + (0 if running else 1)):
+                log_queue.task_done()
+
+    if fd is not None:
+        os.close(fd)
 
 
 def zlog(
@@ -111,10 +267,13 @@ def zlog(
     console: bool = False,
 ) -> None:
     exception_message = str(exception)
-    force_debug = bool(os.getenv("FORCE_DEBUG", False))
-    message = exception_message
     if isinstance(exception, Exception):
-        message += f" of type {type(exception).__name__}"
-    if console or force_debug:
-        print(message)
-    log(message, level, success)
+        exception_message += f" of type {type(exception).__name__}"
+    if _captured_logs is not None:
+        _captured_logs.append((exception_message, level, success, console))
+        return
+    force_debug = bool(os.getenv("FORCE_DEBUG", False))
+    enqueue((now(), level, success, exception_message, console or force_debug))
+
+
+atexit.register(stop_writer)
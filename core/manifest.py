@@ -0,0 +1,96 @@
+import os
+
+from typing import Dict, Optional
+
+from core.filer import file_sha256, load_json, save_json
+from core.logger import zlog as log
+
+
+MANIFEST_NAME = '.manifest.json'
+
+Manifest = Dict[str, Dict]
+
+
+def is_up_to_date(manifest: Manifest, pdf_path: str, excel_path: str) -> bool:
+    try:
+        entry = manifest['files'].get(os.path.basename(pdf_path))
+        if entry is None or not os.path.exists(excel_path):
+            return False
+
+        stat = os.stat(pdf_path)
+        if entry['size'] != stat.st_size:
+            return False
+        if entry['mtime_ns'] == stat.st_mtime_ns:
+            return True
+
+        # Touched but possibly not changed (copied, restored from backup...).
+        if entry['sha256'] == file_sha256(pdf_path):
+            entry['mtime_ns'] = stat.st_mtime_ns
+            manifest['dirty'] = True
+            return True
+        return False
+    except Exception as e:
+        error = f"Error checking manifest entry for {pdf_path}: {e}"
+        log(error, "WARNING")
+        return False
+
+
+def load_manifest(folder: str, parser_version: str) -> Manifest:
+    manifest_path = os.path.join(folder, MANIFEST_NAME)
+    empty = {'parser_version': parser_version, 'files': {}, 'dirty': False}
+    manifest = load_json(manifest_path, 'manifest')
+    if manifest is None:
+        return empty
+    if manifest.get('parser_version') != parser_version:
+        log(f"Parser version changed, rebuilding {manifest_path}", "INFO")
+        empty['dirty'] = True
+        return empty
+    manifest.setdefault('files', {})
+    manifest['dirty'] = False
+    return manifest
+
+
+def record_file(
+        manifest: Manifest, pdf_path: str, excel_path: str,
+        sha256: Optional[str] = None) -> Optional[Dict]:
+    # sha256 is the digest taken when the PDF was discovered, if any.
+    try:
+        stat = os.stat(pdf_path)
+        if sha256 is None:
+            sha256 = file_sha256(pdf_path)
+        if sha256 is None:
+            return None
+        entry = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': sha256,
+            'output': os.path.basename(excel_path),
+        }
+        manifest['files'][os.path.basename(pdf_path)] = entry
+        manifest['dirty'] = True
+        return entry
+    except Exception as e:
+        error = f"Error recording manifest entry for {pdf_path}: {e}"
+        log(error, "WARNING")
+        return None
+
+
+def remove_file(manifest: Manifest, pdf_path: str) -> None:
+    if manifest['files'].pop(os.path.basename(pdf_path), None) is not None:
+        manifest['dirty'] = True
+
+
+def restore_file(manifest: Manifest, pdf_path: str, entry: Dict) -> None:
+    # Puts back an entry recorded by an earlier, interrupted run.
+    manifest['files'][os.path.basename(pdf_path)] = entry
+    manifest['dirty'] = True
+
+
+def save_manifest(folder: str, manifest: Manifest) -> bool:
+    if not manifest.get('dirty'):
+        return True
+    data = {key: value for key, value in manifest.items() if key != 'dirty'}
+    if not save_json(os.path.join(folder, MANIFEST_NAME), data, 'manifest'):
+        return False
+    manifest['dirty'] = False
+    return True
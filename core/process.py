@@ -1,97 +1,504 @@
-import openpyxl
-import pandas as pd
-import pdfplumber
-import json
 import os
+import queue
 import re
+import threading
+import time
 
 from datetime import datetime
-from dateutil import parser
-from dotenv import load_dotenv
-from openpyxl.styles import PatternFill
-from openpyxl.utils import get_column_letter
-from typing import Dict, List, Optional, Tuple, Union
-
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from core.cache import cache_get, cache_put
+from core.dedup import DEDUP_INDEX_NAME, KIND_IDENTICAL, DedupIndex, load_dedup_index
+from core.filer import file_sha256
+from core.isolate import (
+    OUTCOME_CRASHED, OUTCOME_DONE, OUTCOME_OVER_MEMORY, OUTCOME_TIMED_OUT,
+    IsolatedResult, WorkerPool, has_budget, iter_isolated)
+from core.journal import (
+    JOURNAL_NAME, STATE_CONVERTED, STATE_FAILED, Journal, load_journal, open_journal)
+from core.logger import Log_Record, capture_logs, release_logs, replay_logs
 from core.logger import zlog as log
-
-
-load_dotenv()
-
-
-def batch_convert(target_dir: Optional[str] = None) -> bool:
+from core.manifest import (
+    Manifest, is_up_to_date, load_manifest, record_file, remove_file,
+    restore_file, save_manifest)
+from core.quarantine import (
+    QUARANTINE_NAME, Quarantine, is_quarantined, load_quarantine, quarantine_file,
+    release_file, save_quarantine)
+from core.record import (
+    INVOICE_TABLE, LINE_ITEM_TABLE, TABLES, Invoice, Product, to_dataframe)
+from core.scan import scan_pdfs
+from core.settings import Settings, get_settings
+from core.template import (
+    PRODUCT_GROUPS, Template, get_templates, identify_template, registry_version)
+from core.timing import (
+    FILE_STAGES, TEXT_OUTPUT_STAGES, RunReport, Stage_Timings, failed_stage,
+    format_summary, save_report, span)
+from core.writer import (
+    ConsolidatedWriter, TableWriter, write_csv, write_excel, write_jsonl)
+
+# pandas, dateutil and the PDF libraries are imported where they are used, so
+# starting the CLI (--help, --dry-run, runs with nothing to do) stays fast.
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Bump whenever a change to the parsing rules alters the output, so the
+# manifests written by earlier runs stop matching and files are reconverted.
+PARSER_VERSION = '5'
+
+# Jobs carry the PDF's SHA-256 when discovery already hashed it (None
+# otherwise), so the cache and the manifest do not hash it again.
+Mapping_Job = Tuple[str, Settings, Optional[str]]
+Mapping_Result = Tuple[str, Optional[Invoice], List[Log_Record], Stage_Timings]
+
+CITY_STATE_ZIP_PATTERN = re.compile(r'^[\w\s]+,\s*\w+\s+\d+')
+CURRENCY_PATTERN = re.compile(r'[^\d$.]')
+EMAIL_PATTERN = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+PHONE_DIGITS_PATTERN = re.compile(r'\d{3}[-.\s]?\d{3}[-.\s]?\d{4}')
+PHONE_PATTERN = re.compile(
+    r'((\+?1\s*)?(\(\d{3}\)\s*|\d{3}[-.\s]?)\d{3}[-.\s]?\d{4})')
+PO_BOX_PATTERN = re.compile(r'P\.?O\.?\s*Box\s+\d+', re.IGNORECASE)
+TRADITIONAL_ADDRESS_PATTERN = re.compile(r'^\d+\s[\w\s]+')
+
+MONTHS = [
+    'January', 'February', 'March', 'April', 'May', 'June', 'July',
+    'August', 'September', 'October', 'November', 'December',
+]
+DATE_PATTERN = re.compile(
+    r'(?P<month_name>' + '|'.join(MONTHS) + r')\s+(?P<day>\d{1,2}),\s+(?P<year>\d{4})'
+    r'|(?P<month>\d{1,2})/(?P<short_day>\d{1,2})/(?P<short_year>\d{4}|\d{2})(?!\d)')
+# Dates more than this many years away from today are ignored.
+YEAR_RANGE = 10
+
+PRODUCT_HEADERS = (
+    "Product Description Cost per Item Qty Price",
+    "Product Description",
+    "Description Quantity Price Total Price",
+)
+
+SECTION_MAIN = 'main'
+SECTION_PRODUCTS = 'products'
+SECTION_TRAILER = 'trailer'
+
+STATUS_CONVERTED = 'converted'
+STATUS_FAILED = 'failed'
+STATUS_SKIPPED = 'skipped'
+STATUS_QUARANTINED = 'quarantined'
+STATUS_DUPLICATE = 'duplicate'
+# Files stopped by their worker pool budget; they go on the quarantine list.
+QUARANTINE_STATUSES = (OUTCOME_TIMED_OUT, OUTCOME_OVER_MEMORY, OUTCOME_CRASHED)
+
+# Mapped invoices waiting for the writer thread, and finished results waiting
+# for the caller. They bound how far extraction can run ahead of writing, and
+# writing ahead of a slow consumer.
+WRITE_QUEUE_SIZE = 32
+RESULT_QUEUE_SIZE = 32
+# How often a stage blocked on a full or empty queue checks for cancellation.
+QUEUE_POLL_SECONDS = 0.25
+
+
+class LineFeatures(NamedTuple):
+    # Every classifier predicate evaluated once for a stripped line, so the
+    # parse_* helpers can share the results instead of re-running regexes.
+    line: str
+    traditional_address: bool
+    po_box: bool
+    city_state_zip: bool
+    phone: bool
+    email: bool
+    invoice_or_purchase: bool
+
+    @property
+    def department(self) -> bool:
+        return not (
+            self.traditional_address or self.po_box or self.city_state_zip or
+            self.phone or self.email or self.invoice_or_purchase)
+
+
+class ConversionResult(NamedTuple):
+    pdf_path: str
+    excel_path: str
+    status: str
+    timings: Stage_Timings
+    invoice: Optional[Invoice]
+    sha256: Optional[str] = None
+
+
+class DiscoveredPdf(NamedTuple):
+    pdf_path: str
+    excel_path: str
+    # None for a PDF to convert, otherwise the status it is skipped with.
+    skip: Optional[str]
+    # Only computed for PDFs to convert.
+    sha256: Optional[str]
+
+
+def add_invoice_rows(writer: TableWriter, invoice: Invoice, source_file: str) -> None:
+    writer.add(INVOICE_TABLE, invoice.invoice_row(source_file))
+    for row in invoice.line_item_rows(source_file):
+        writer.add(LINE_ITEM_TABLE, row)
+
+
+def batch_convert(
+        target_dir: Optional[str] = None,
+        settings: Optional[Settings] = None) -> bool:
     try:
         if target_dir is None:
             target_dir = os.path.dirname(os.path.abspath(__file__))
+        if settings is None:
+            settings = get_settings()
     except Exception as e:
         error = f"Error getting target directory: {e}"
         log(error, "FATAL")
         raise Exception(error)
 
-    for root, _, files in os.walk(target_dir):
-        processed_dir = os.getenv('PROCESSED_DIR', 'processed')
-        processed_folder = os.path.join(root, processed_dir)
-
-        for pdf_file in files:
-            if pdf_file.endswith('.pdf'):
-                if not os.path.exists(processed_folder):
-                    os.mkdir(processed_folder)
-
-                pdf_path = os.path.join(root, pdf_file)
-
-                excel_path = os.path.join(
-                    processed_folder, pdf_file.replace('.pdf', '.xlsx'))
-
-                try:
-                    if pdf_to_excel(pdf_path, excel_path):
-                        success = f"Processed {pdf_file} -> {excel_path}"
-                        log(success, "INFO", True)
-                    else:
-                        if os.path.exists(excel_path):
-                            kinda_success = f"Processed {pdf_file} -> {excel_path} but without formatting!"
-                            log(kinda_success, "WARNING")
-                        else:
-                            raise Exception(
-                                "Error processing pdf to excel!")
-                except Exception as e:
-                    error = f"Error processing {pdf_file} -> {e}"
-                    log(error, "ERROR")
-                    continue
+    if settings.consolidated_path is not None:
+        return consolidate(target_dir, settings)
+
+    report = RunReport(target_dir, get_file_stages(settings))
+    run_timings: Stage_Timings = {}
+    manifests: Dict[str, Manifest] = {}
+    journal = start_journal(target_dir, settings, manifests)
+    quarantine_path = get_quarantine_path(target_dir, settings)
+    quarantine = load_quarantine(quarantine_path)
+    dedup = open_dedup_index(target_dir, settings)
+    failed_paths: List[str] = []
+    held = 0
+    copies = 0
+    finished = False
+    try:
+        for result in iter_conversions(
+                target_dir, settings, manifests, run_timings, quarantine, dedup):
+            if result.status in (STATUS_SKIPPED, STATUS_QUARANTINED, STATUS_DUPLICATE):
+                report.skipped += 1
+                held += result.status == STATUS_QUARANTINED
+                if result.status == STATUS_DUPLICATE:
+                    # A forced run can retry a quarantined PDF that turns out to
+                    # be a copy; it is not converted, so its entry goes here.
+                    copies += 1
+                    release_file(quarantine, os.path.relpath(result.pdf_path, target_dir))
+                    report_duplicate(report, dedup, result.pdf_path, True)
+                continue
+            converted = result.status == STATUS_CONVERTED
+            relative_path = os.path.relpath(result.pdf_path, target_dir)
+            if converted and dedup is not None:
+                report_duplicate(report, dedup, result.pdf_path, False)
+            entry = record_conversion(
+                manifests, result.pdf_path, result.excel_path, converted, result.sha256)
+            if journal is not None:
+                journal.record(
+                    relative_path, STATE_CONVERTED if entry is not None else STATE_FAILED, entry)
+            if result.status in QUARANTINE_STATUSES:
+                stage = failed_stage(result.timings, report.file_stages)
+                quarantine_file(
+                    quarantine, relative_path, result.pdf_path, result.status, stage)
+                report.add_quarantined(result.pdf_path, result.status, stage)
+            elif converted:
+                release_file(quarantine, relative_path)
+            report.add_file(result.pdf_path, result.timings, converted)
+            if not converted:
+                failed_paths.append(result.pdf_path)
+        finished = True
+    except Exception as e:
+        error = f"Error in conversion pipeline: {e}"
+        log(error, "FATAL")
+        raise Exception(error)
+    finally:
+        for processed_folder, manifest in manifests.items():
+            if os.path.isdir(processed_folder):
+                save_manifest(processed_folder, manifest)
+        if journal is not None:
+            if finished:
+                journal.finish()
+            journal.close()
+        save_quarantine(quarantine_path, quarantine)
+        if dedup is not None:
+            for pdf_path in failed_paths:
+                dedup.release(pdf_path)
+            dedup.save()
+        if held:
+            log(f"Skipped {held} quarantined PDF(s), see {quarantine_path} "
+                f"(--force retries them)", "WARNING", True)
+        if report.skipped > held + copies:
+            log(f"Skipped {report.skipped - held - copies} unchanged PDF(s) in {target_dir}",
+                "INFO", True)
+        report.add_span('scan', run_timings.get('scan', 0.0))
+        finish_report(report, settings)
+    return not failed_paths
+
+
+def classify_line(line: str) -> LineFeatures:
+    line = line.strip()
+    return LineFeatures(
+        line=line,
+        traditional_address=is_traditional_address(line),
+        po_box=is_po_box_address(line),
+        city_state_zip=is_city_state_zip_line(line),
+        phone=contains_phone_number(line),
+        email=contains_email_address(line),
+        invoice_or_purchase=starts_with_invoice_or_purchase(line),
+    )
 
 
 def clean_currency(value: str) -> str:
-    return re.sub(r'[^\d$.]', '', value)
+    return CURRENCY_PATTERN.sub('', value)
+
+
+def collect_invoice_pages(pages: Iterable[str]) -> List[str]:
+    # Pulls pages one at a time and stops after the page holding the Freight
+    # line that ends the product table; trailing pages are never extracted.
+    texts = []
+    header_found = False
+    for text in pages:
+        texts.append(text or '')
+        for line in (text or '').split('\n'):
+            line = line.strip()
+            if not header_found:
+                header_found = is_product_header(line)
+            elif parse_freight(line)[1]:
+                return texts
+    return texts
+
+
+def consolidate(target_dir: str, settings: Settings) -> bool:
+    consolidated_path = settings.consolidated_path
+    if not consolidated_path:
+        consolidated_path = os.path.join(
+            target_dir, settings.processed_dir, f"consolidated.{settings.output_format}")
+    os.makedirs(os.path.dirname(os.path.abspath(consolidated_path)), exist_ok=True)
+
+    report = RunReport(target_dir, get_file_stages(settings))
+    quarantine_path = get_quarantine_path(target_dir, settings)
+    quarantine = load_quarantine(quarantine_path)
+    dedup = open_dedup_index(target_dir, settings)
+    scan_started = time.perf_counter()
+    pdf_paths = [pdf.path for pdf in scan_pdfs(target_dir, settings)]
+    held = 0
+    if not settings.force:
+        scanned = len(pdf_paths)
+        pdf_paths = [
+            pdf_path for pdf_path in pdf_paths if not is_quarantined(
+                quarantine, os.path.relpath(pdf_path, target_dir), pdf_path)]
+        held = scanned - len(pdf_paths)
+        report.skipped += held
+    hashes: Dict[str, Optional[str]] = {}
+    if dedup is not None:
+        # Byte-identical copies are left out before anything is extracted.
+        copies = set()
+        for pdf_path in pdf_paths:
+            original, hashes[pdf_path] = dedup.check_file(pdf_path)
+            if original is not None:
+                copies.add(pdf_path)
+                release_file(quarantine, os.path.relpath(pdf_path, target_dir))
+                report_duplicate(report, dedup, pdf_path, True)
+        report.skipped += len(copies)
+        pdf_paths = [pdf_path for pdf_path in pdf_paths if pdf_path not in copies]
+    report.add_span('scan', time.perf_counter() - scan_started)
+
+    if settings.schema == 'normalized':
+        writer = TableWriter(consolidated_path, TABLES, settings)
+    else:
+        writer = ConsolidatedWriter(consolidated_path, settings)
+    jobs = [(pdf_path, settings, hashes.get(pdf_path)) for pdf_path in pdf_paths]
+
+    def isolated_results():
+        # Same budgets and quarantine as a batch run.
+        for isolated in iter_isolated(map_job, jobs, settings):
+            pdf_path = isolated.job[0]
+            relative_path = os.path.relpath(pdf_path, target_dir)
+            if isolated.outcome == OUTCOME_DONE:
+                if isolated.result[1] is not None:
+                    release_file(quarantine, relative_path)
+                yield isolated.result
+                continue
+            stage = report_stopped(isolated, settings)
+            quarantine_file(quarantine, relative_path, pdf_path, isolated.outcome, stage)
+            report.add_quarantined(pdf_path, isolated.outcome, stage)
+            yield pdf_path, None, [], isolated.timings
+
+    default_sheet = 'Invoices'
+    converted = 0
+    try:
+        if settings.workers <= 1 and not has_budget(settings):
+            results = (map_job(job, capture=False) for job in jobs)
+        else:
+            results = isolated_results()
+        converted = consolidate_results(
+            writer, target_dir, results, settings.sheet_per_directory,
+            default_sheet, report, dedup, settings.dedup == 'skip')
+    except Exception as e:
+        error = f"Error in worker pool: {e}"
+        log(error, "FATAL")
+        raise Exception(error)
+    finally:
+        write_started = time.perf_counter()
+        written = writer.close()
+        report.add_span('write', time.perf_counter() - write_started)
+        save_quarantine(quarantine_path, quarantine)
+        if dedup is not None:
+            dedup.save()
+        if held:
+            log(f"Skipped {held} quarantined PDF(s), see {quarantine_path} "
+                f"(--force retries them)", "WARNING", True)
+        finish_report(report, settings)
+
+    if written:
+        success = f"Consolidated {converted} of {len(pdf_paths)} PDF(s) -> {consolidated_path}"
+        log(success, "INFO", True)
+    return written
+
+
+def consolidate_results(
+        writer: Union[ConsolidatedWriter, TableWriter], target_dir: str,
+        results: Iterable[Mapping_Result], sheet_per_directory: bool,
+        default_sheet: str, report: Optional[RunReport] = None,
+        dedup: Optional[DedupIndex] = None, skip_duplicates: bool = False) -> int:
+    converted = 0
+    for pdf_path, invoice, records, timings in results:
+        replay_logs(records)
+        relative_path = os.path.relpath(pdf_path, target_dir)
+        if invoice is None:
+            if report is not None:
+                report.add_file(pdf_path, timings, False)
+            error = f"Error processing {relative_path} -> not added to consolidated output"
+            log(error, "ERROR")
+            if dedup is not None:
+                dedup.release(pdf_path)
+            continue
+        if dedup is not None and dedup.check_invoice(pdf_path, invoice, skip_duplicates):
+            if report is not None:
+                report_duplicate(report, dedup, pdf_path, skip_duplicates)
+            if skip_duplicates:
+                # Counted as skipped, like a copy left out of a batch run.
+                if report is not None:
+                    report.skipped += 1
+                continue
+        if report is not None:
+            report.add_file(pdf_path, timings, True)
+        if isinstance(writer, TableWriter):
+            add_invoice_rows(writer, invoice, relative_path)
+            converted += 1
+            continue
+        sheet = default_sheet
+        if sheet_per_directory:
+            relative_dir = os.path.dirname(relative_path)
+            sheet = relative_dir.replace(os.sep, ' - ') if relative_dir else default_sheet
+        writer.add(sheet, {'Source File': relative_path, **invoice.to_row()})
+        converted += 1
+    return converted
 
 
 def contains_email_address(line: str) -> bool:
-    pattern = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
-    return bool(pattern.search(line))
+    return bool(EMAIL_PATTERN.search(line))
 
 
 def contains_phone_number(line: str) -> bool:
-    pattern = re.compile(
-        r'((\+?1\s*)?(\(\d{3}\)\s*|\d{3}[-.\s]?)\d{3}[-.\s]?\d{4})'
-    )
-    return bool(pattern.search(line))
+    return bool(PHONE_PATTERN.search(line))
+
+
+def discover_pdfs(
+        target_dir: str, settings: Settings, manifests: Dict[str, Manifest],
+        timings: Optional[Stage_Timings] = None,
+        quarantine: Optional[Quarantine] = None,
+        dedup: Optional[DedupIndex] = None) -> Iterator[DiscoveredPdf]:
+    # Yields each PDF, largest first, where skip is None for a PDF to convert, STATUS_SKIPPED when it is up to date,
+    # STATUS_QUARANTINED when it is unchanged on the quarantine list or
+    # STATUS_DUPLICATE when it is a byte-identical copy of a converted PDF
+    # (only checked for PDFs that would be converted). The tree
+    # is listed up front (cheap), the manifests are checked lazily. Time spent
+    # on both is added to timings['scan']. Nothing is created on disk: output
+    # folders are made by write_stage when the first file in them is written.
+    started = time.perf_counter()
+    for pdf in scan_pdfs(target_dir, settings, largest_first=True):
+        excel_path = get_output_path(pdf.path, settings)
+        processed_folder = os.path.dirname(excel_path)
+        if processed_folder not in manifests:
+            manifests[processed_folder] = load_manifest(
+                processed_folder, get_manifest_version(settings))
+
+        skip = None
+        if settings.force:
+            pass
+        elif quarantine is not None and is_quarantined(
+                quarantine, os.path.relpath(pdf.path, target_dir), pdf.path):
+            skip = STATUS_QUARANTINED
+        elif is_up_to_date(manifests[processed_folder], pdf.path, excel_path):
+            skip = STATUS_SKIPPED
+        # PDFs to convert are hashed here, once, for the dedup index, the
+        # extraction cache and the manifest.
+        sha256 = None
+        if skip is None and dedup is not None:
+            original, sha256 = dedup.check_file(pdf.path, recheck=settings.force)
+            if original is not None:
+                skip = STATUS_DUPLICATE
+        elif skip is None:
+            sha256 = file_sha256(pdf.path)
+
+        if timings is not None:
+            timings['scan'] = timings.get('scan', 0.0) + time.perf_counter() - started
+        yield DiscoveredPdf(pdf.path, excel_path, skip, sha256)
+        started = time.perf_counter()
+
+    if timings is not None:
+        timings['scan'] = timings.get('scan', 0.0) + time.perf_counter() - started
+
+
+def extract_pdf_text(
+        pdf_path: str, settings: Optional[Settings] = None,
+        timings: Optional[Stage_Timings] = None, sha256: Optional[str] = None) -> str:
+    # Records 'open' and 'extract' when a timings dict is passed. Cache hits
+    # never open the PDF and count as extraction time.
+    if settings is None:
+        settings = get_settings()
+    started = time.perf_counter()
+
+    from core.extract import get_extractor
+
+    extractor = get_extractor(settings.extractor)
+    cache_key = f"{extractor.key()}:to-freight"
+
+    if not settings.cache_path:
+        sha256 = None
+    elif sha256 is None:
+        sha256 = file_sha256(pdf_path)
+    if sha256 is not None:
+        text = cache_get(settings.cache_path, sha256, cache_key)
+        if text is not None:
+            if timings is not None:
+                timings['open'] = 0.0
+                timings['extract'] = time.perf_counter() - started
+            return text
+
+    pages = extractor.iter_page_text(pdf_path, timings)
+    try:
+        texts = collect_invoice_pages(pages)
+    finally:
+        pages.close()
+    text = '\n'.join(texts)
+
+    if sha256 is not None:
+        words = None
+        if settings.cache_words:
+            words = extractor.extract_words(pdf_path, len(texts))
+        cache_put(
+            settings.cache_path, sha256, cache_key, text,
+            settings.cache_max_mb * 1024 * 1024, words)
+    if timings is not None:
+        timings['extract'] = time.perf_counter() - started - timings.get('open', 0.0)
+    return text
 
 
 def find_and_parse_date(lines: List[str]) -> Tuple[Dict, Union[int, None]]:
     try:
-        date_pattern = (
-            r"(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},\s+\d{4}|\d{1,2}/\d{1,2}/\d{2,4}"
-        )
-
-        for index, line in enumerate(lines):
-            for year in get_years_to_search():
-                if str(year) in line or f"/{str(year)[2:]}" in line:
-                    match = re.search(date_pattern, line)
-                    if match:
-                        date_str = match.group(0)
-                        try:
-                            date = parser.parse(date_str.strip(), fuzzy=True)
-                            data = {'Date': date.strftime('%m/%d/%Y')}
-                            return data, index
-                        except ValueError:
-                            print(f"Error parsing date: {date_str.strip()}")
+        text = '\n'.join(lines)
+        current_year = datetime.now().year
+
+        for match in DATE_PATTERN.finditer(text):
+            date = parse_date_match(match, current_year)
+            if date is not None:
+                index = text.count('\n', 0, match.start())
+                return {'Date': date.strftime('%m/%d/%Y')}, index
+
+        log("No date found, falling back to today's date", "WARNING")
         data = {'Date': datetime.now().strftime('%m/%d/%Y')}
         return data, None
     except Exception as e:
@@ -100,220 +507,321 @@ def find_and_parse_date(lines: List[str]) -> Tuple[Dict, Union[int, None]]:
         return {}, None
 
 
-def find_header_fill_index(lines: List[str], start_index: int) -> int:
-    product_header = None
+def find_header_fill_index(lines: List[str], start_index: int) -> Optional[int]:
+    for index in range(start_index, len(lines)):
+        if is_product_header(lines[index]):
+            return index
+    return None
 
-    for line in lines[start_index:]:
-        if line.startswith("Product Description Cost per Item Qty Price"):
-            product_header = lines.index(line)
-            break
-        elif line.startswith("Product Description"):
-            product_header = lines.index(line)
-            break
-        elif line.startswith("Description Quantity Price Total Price"):
-            product_header = lines.index(line)
-            break
 
-    return product_header
+def finish_report(report: RunReport, settings: Settings) -> None:
+    # report_path None writes next to the output, '' only logs the summary.
+    summary = report.summary()
+    log(format_summary(summary), "INFO", True)
+    if settings.report_path == '':
+        return
+    report_path = settings.report_path or os.path.join(
+        report.target_dir, settings.processed_dir, 'run-report.json')
+    if save_report(report_path, summary):
+        log(f"Run report -> {report_path}", "INFO")
 
 
-def format_excel(excel_path) -> bool:
-    try:
-        wb = openpyxl.load_workbook(excel_path)
-        ws = wb.active
-
-        header_fill = os.getenv('HEADER_FILL', json.dumps(
-            ['4CAF50', '4CAF50', 'solid']))
-
-        header_start_color, header_end_color, header_fill_type = json.loads(
-            header_fill)
-
-        green_fill = PatternFill(
-            start_color=header_start_color,
-            end_color=header_end_color,
-            fill_type=header_fill_type
-        )
-
-        last_header_col = 0
-        for cell in ws["1:1"]:
-            if cell.value is not None:
-                last_header_col = cell.column
-                cell.fill = green_fill
-
-        ws.auto_filter.ref = f"A1:{get_column_letter(last_header_col)}1"
-
-        for col in range(1, last_header_col + 1):
-            max_length = 0
-            col_letter = get_column_letter(col)
-            for cell in ws[col_letter]:
-                if cell.value is not None:
-                    max_length = max(max_length, len(str(cell.value)))
-            adjusted_width = max_length + 2
-            ws.column_dimensions[col_letter].width = adjusted_width
-
-        wb.save(excel_path)
-        return True
-    except Exception as e:
-        error = f"Error formatting excel -> {excel_path}: {e}"
-        log(error, "WARNING")
-        return False
+def get_file_stages(settings: Settings) -> Tuple[str, ...]:
+    if settings.output_format == 'xlsx' and settings.schema == 'wide':
+        return FILE_STAGES
+    return TEXT_OUTPUT_STAGES
 
 
-def get_years_to_search(year_range: int = 10) -> List[int]:
-    current_year = datetime.now().year
-    try:
-        years_to_search = [current_year +
-                           i for i in range(-year_range, year_range + 1)]
-        years_to_search = sorted(
-            years_to_search, key=lambda x: abs(current_year - x))
-        return years_to_search
-    except Exception as e:
-        error = f"Error getting years to search: {e} -> returning current year!"
-        log(error, "WARNING")
-        return [current_year]
+def get_manifest_version(settings: Settings) -> str:
+    # The schema and layout templates change the output without changing its
+    # path.
+    version = f"{PARSER_VERSION}:{settings.extractor}"
+    if settings.schema != 'wide':
+        version = f"{version}:{settings.schema}"
+    templates = registry_version(settings.templates_path)
+    if templates:
+        version = f"{version}:templates-{templates}"
+    return version
+
+
+def get_output_path(pdf_path: str, settings: Settings) -> str:
+    pdf_dir, pdf_file = os.path.split(pdf_path)
+    return os.path.join(
+        pdf_dir, settings.processed_dir,
+        f"{os.path.splitext(pdf_file)[0]}.{settings.output_format}")
+
+
+def get_quarantine_path(target_dir: str, settings: Settings) -> str:
+    return os.path.join(target_dir, settings.processed_dir, QUARANTINE_NAME)
+
+
+def get_unless_stopped(source: queue.Queue, stop: threading.Event) -> Any:
+    # Returns None once the pipeline is cancelled, like the end of the stream.
+    while not stop.is_set():
+        try:
+            return source.get(timeout=QUEUE_POLL_SECONDS)
+        except queue.Empty:
+            continue
+    return None
 
 
 def is_city_state_zip_line(line: str) -> bool:
-    pattern = re.compile(r'^[\w\s]+,\s*\w+\s+\d+')
-    return bool(pattern.match(line))
+    return bool(CITY_STATE_ZIP_PATTERN.match(line))
 
 
 def is_department_line(line: str) -> bool:
-    if (
-        not is_traditional_address(line) and
-        not is_po_box_address(line) and
-        not is_city_state_zip_line(line) and
-        not contains_phone_number(line) and
-        not contains_email_address(line) and
-        not starts_with_invoice_or_purchase(line)
-    ):
-        return True
-    else:
-        return False
+    return classify_line(line).department
 
 
 def is_po_box_address(line: str) -> bool:
-    pattern = re.compile(r'P\.?O\.?\s*Box\s+\d+', re.IGNORECASE)
-    return bool(pattern.match(line))
+    return bool(PO_BOX_PATTERN.match(line))
+
+
+def is_product_header(line: str) -> bool:
+    return line.startswith(PRODUCT_HEADERS)
 
 
 def is_traditional_address(line: str) -> bool:
-    pattern = re.compile(r'^\d+\s[\w\s]+')
-    return bool(pattern.match(line))
+    return bool(TRADITIONAL_ADDRESS_PATTERN.match(line))
 
 
 def isolate_email(line: str) -> str:
-    pattern = re.compile(
-        r'([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})'
-    )
-    match = pattern.search(line)
+    match = EMAIL_PATTERN.search(line)
     return match.group(0) if match else None
 
 
 def isolate_number(line: str) -> str:
-    pattern = re.compile(
-        r'((\+?1\s*)?(\(\d{3}\)\s*|\d{3}[-.\s]?)\d{3}[-.\s]?\d{4})'
-    )
-    match = pattern.search(line)
+    match = PHONE_PATTERN.search(line)
     return match.group(0) if match else None
 
 
-def map_text_to_excel_columns(text: str) -> pd.DataFrame:
+def iter_conversions(
+        target_dir: str, settings: Settings,
+        manifests: Optional[Dict[str, Manifest]] = None,
+        timings: Optional[Stage_Timings] = None,
+        quarantine: Optional[Quarantine] = None,
+        dedup: Optional[DedupIndex] = None) -> Iterator[ConversionResult]:
+    # Streams discovered PDFs through extraction/mapping (worker processes)
+    # and a writer thread, connected by bounded queues, yielding one result per
+    # PDF as soon as it is written. Manifests are loaded into `manifests` as
+    # folders are discovered; recording conversions is up to the caller.
+    if manifests is None:
+        manifests = {}
+    write_queue: queue.Queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+    results: queue.Queue = queue.Queue(maxsize=RESULT_QUEUE_SIZE)
+    stop = threading.Event()
+    pdfs = discover_pdfs(target_dir, settings, manifests, timings, quarantine, dedup)
+    threads = [
+        threading.Thread(
+            target=map_stage, args=(pdfs, settings, write_queue, results, stop, dedup),
+            name='map-stage', daemon=True),
+        threading.Thread(
+            target=write_stage, args=(write_queue, results, settings, stop),
+            name='write-stage', daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
     try:
-        lines = text.strip().split('\n')
-        mapped_data = {}
+        while True:
+            result = results.get()
+            if result is None:
+                break
+            if isinstance(result, Exception):
+                raise result
+            yield result
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def map_job(
+        job: Mapping_Job, capture: bool = True,
+        timings: Optional[Stage_Timings] = None) -> Mapping_Result:
+    pdf_path, settings, sha256 = job
+    if timings is None:
+        timings = {}
+    if capture:
+        capture_logs()
+    try:
+        invoice = pdf_to_invoice(pdf_path, settings, timings, sha256)
+    finally:
+        records = release_logs() if capture else []
+    return pdf_path, invoice, records, timings
+
+
+def map_stage(
+        pdfs: Iterator[DiscoveredPdf], settings: Settings,
+        write_queue: queue.Queue, results: queue.Queue,
+        stop: threading.Event, dedup: Optional[DedupIndex] = None) -> None:
+    def hand_off(pdf_path, excel_path, invoice, timings, sha256):
+        if invoice is None:
+            put_unless_stopped(results, ConversionResult(
+                pdf_path, excel_path, STATUS_FAILED, timings, None, sha256), stop)
+            return
+        skip = settings.dedup == 'skip'
+        if dedup is not None and dedup.check_invoice(pdf_path, invoice, skip) and skip:
+            put_unless_stopped(results, ConversionResult(
+                pdf_path, excel_path, STATUS_DUPLICATE, timings, invoice, sha256), stop)
+            return
+        put_unless_stopped(
+            write_queue, (pdf_path, excel_path, invoice, timings, sha256), stop)
+
+    def collect(finished: List[IsolatedResult]):
+        for isolated in finished:
+            pdf_path, _, sha256 = isolated.job
+            excel_path = isolated.tag
+            if isolated.outcome == OUTCOME_DONE:
+                _, invoice, records, timings = isolated.result
+                replay_logs(records)
+                hand_off(pdf_path, excel_path, invoice, timings, sha256)
+                continue
+            report_stopped(isolated, settings)
+            put_unless_stopped(results, ConversionResult(
+                pdf_path, excel_path, isolated.outcome, isolated.timings, None, sha256), stop)
+
+    try:
+        if settings.workers <= 1 and not has_budget(settings):
+            for pdf_path, excel_path, skip, sha256 in pdfs:
+                if stop.is_set():
+                    break
+                if skip is not None:
+                    put_unless_stopped(
+                        results, ConversionResult(pdf_path, excel_path, skip, {}, None), stop)
+                    continue
+                _, invoice, _, timings = map_job((pdf_path, settings, sha256), capture=False)
+                hand_off(pdf_path, excel_path, invoice, timings, sha256)
+            return
+
+        # One file at a time per worker process, so every file runs under
+        # its own time and memory budget.
+        pool = WorkerPool(map_job, settings)
+        try:
+            for pdf_path, excel_path, skip, sha256 in pdfs:
+                if stop.is_set():
+                    break
+                if skip is not None:
+                    put_unless_stopped(
+                        results, ConversionResult(pdf_path, excel_path, skip, {}, None), stop)
+                    continue
+                while not pool.has_capacity() and not stop.is_set():
+                    collect(pool.collect())
+                if stop.is_set():
+                    break
+                pool.submit((pdf_path, settings, sha256), excel_path)
+            while pool.busy() and not stop.is_set():
+                collect(pool.collect())
+        finally:
+            pool.close()
+    except Exception as e:
+        put_unless_stopped(results, e, stop)
+    finally:
+        put_unless_stopped(write_queue, None, stop)
 
-        date_data, date_index = find_and_parse_date(lines)
-        mapped_data.update(date_data)
 
-        document_data, document_end_index = parse_main_section(
-            lines, date_index + 1)
-        mapped_data.update(document_data)
+def map_text_to_columns(text: str, settings: Optional[Settings] = None) -> Dict:
+    invoice = map_text_to_invoice(text, settings)
+    return {} if invoice is None else invoice.to_row()
 
-        invoice_data, invoice_po_end_index = parse_invoice_and_purchase_order(
-            lines, document_end_index)
-        mapped_data.update(invoice_data)
 
-        product_data, freight_index = parse_products(
-            lines, invoice_po_end_index)
-        for i, product in enumerate(product_data):
-            for key, value in product.items():
-                mapped_data[f"{key}_{i}"] = value
+def map_text_to_excel_columns(
+        text: str, settings: Optional[Settings] = None) -> 'pd.DataFrame':
+    invoice = map_text_to_invoice(text, settings)
+    if invoice is None or invoice.is_empty():
+        return to_dataframe([])
+    return to_dataframe([invoice])
 
-        freight_data = parse_freight(lines, freight_index)
-        mapped_data.update(freight_data)
 
-        return pd.DataFrame([mapped_data])
+def map_text_to_invoice(
+        text: str, settings: Optional[Settings] = None) -> Optional[Invoice]:
+    try:
+        if settings is None:
+            settings = get_settings()
+        lines = text.strip().split('\n')
+        return parse_sections(lines, settings)
     except Exception as e:
         error = f"Error mapping text to excel columns: {e}"
         log(error, "CRITICAL")
-        return pd.DataFrame()
+        return None
+
 
+def open_dedup_index(target_dir: str, settings: Settings) -> Optional[DedupIndex]:
+    if settings.dedup == 'off':
+        return None
+    return load_dedup_index(
+        target_dir, os.path.join(target_dir, settings.processed_dir, DEDUP_INDEX_NAME))
 
-def parse_main_section(lines: List[str], start_index: int) -> Tuple[Dict, int]:
-    data = {}
+
+def parse_main_section(
+        lines: List[str], start_index: int, end_index: int,
+        settings: Optional[Settings] = None,
+        invoice: Optional[Invoice] = None) -> Tuple[Invoice, int]:
+    if settings is None:
+        settings = get_settings()
+    if invoice is None:
+        invoice = Invoice()
     current_index = start_index
-    contact_count = 0
-    product_header = find_header_fill_index(lines, start_index)
 
-    while current_index < product_header:
-        line = lines[current_index].strip()
+    while current_index < end_index:
+        features = classify_line(lines[current_index])
 
-        address_1, success = parse_address_1(line)
+        address_1, success = parse_address_1(features)
         if success:
-            data['Address 1'] = address_1
+            invoice.address_1 = address_1
             current_index += 1
-            line = lines[current_index].strip()
+            if current_index >= end_index:
+                break
+            features = classify_line(lines[current_index])
 
         if address_1:
-            address_2, success = parse_address_2(line)
+            address_2, success = parse_address_2(features)
             if success:
-                data['Address 2'] = address_2
+                invoice.address_2 = address_2
                 current_index += 1
-                line = lines[current_index].strip()
+                if current_index >= end_index:
+                    break
+                features = classify_line(lines[current_index])
 
-        city_state_zip, success = parse_citystatezip(line)
+        city_state_zip, success = parse_citystatezip(features)
         if success:
-            data['City, State, Zip'] = city_state_zip
+            invoice.city_state_zip = city_state_zip
             current_index += 1
-            line = lines[current_index].strip()
+            if current_index >= end_index:
+                break
+            features = classify_line(lines[current_index])
 
-        contact, success = parse_contact(line)
+        contact, success = parse_contact(features)
         while success:
-            contact_count += 1
-            data[f'Contact {contact_count}'] = contact
+            invoice.contacts.append(contact)
             current_index += 1
-            if current_index < product_header:
-                line = lines[current_index].strip()
-                contact, success = parse_contact(line)
+            if current_index < end_index:
+                features = classify_line(lines[current_index])
+                contact, success = parse_contact(features)
             else:
                 break
 
-        phone, success = parse_phone(line)
+        phone, success = parse_phone(features.line, settings)
         if success:
-            data['Phone'] = phone
+            invoice.phone = phone
             current_index += 1
-            if current_index < len(lines):
-                line = lines[current_index].strip()
+            if current_index < end_index:
+                features = classify_line(lines[current_index])
 
-        email, success = parse_email(line)
+        email, success = parse_email(features)
         if success:
-            data['Email'] = email
+            invoice.email = email
             current_index += 1
-            if current_index < len(lines):
-                line = lines[current_index].strip()
         current_index += 1
 
-    return data, current_index
+    return invoice, min(current_index, end_index)
 
 
-def parse_address_1(line: str) -> Tuple[str, bool]:
+def parse_address_1(features: LineFeatures) -> Tuple[str, bool]:
     try:
-        if isinstance(line, str) and not None:
-            if ((is_traditional_address(line) or is_po_box_address(line))) and (
-                not is_city_state_zip_line(line) or not contains_phone_number(line) or
-                    not contains_email_address(line) or not starts_with_invoice_or_purchase(line)):
-                return line.strip(), True
+        if (features.traditional_address or features.po_box) and (
+            not features.city_state_zip or not features.phone or
+                not features.email or not features.invoice_or_purchase):
+            return features.line, True
         return None, False
     except Exception as e:
         error = f"Error parsing address_1: {e}"
@@ -321,13 +829,10 @@ def parse_address_1(line: str) -> Tuple[str, bool]:
         return None, False
 
 
-def parse_address_2(line: str) -> Tuple[str, bool]:
+def parse_address_2(features: LineFeatures) -> Tuple[str, bool]:
     try:
-        if isinstance(line, str) and not None:
-            if (not is_traditional_address(line) and not is_po_box_address(line) and
-                not is_city_state_zip_line(line) and not contains_phone_number(line) and
-                    not contains_email_address(line) and not starts_with_invoice_or_purchase(line)):
-                return line.strip(), True
+        if features.department:
+            return features.line, True
         return None, False
     except Exception as e:
         error = f"Error parsing address_2: {e}"
@@ -335,11 +840,10 @@ def parse_address_2(line: str) -> Tuple[str, bool]:
         return None, False
 
 
-def parse_citystatezip(line: str) -> Tuple[str, bool]:
+def parse_citystatezip(features: LineFeatures) -> Tuple[str, bool]:
     try:
-        if isinstance(line, str) and not None:
-            if is_city_state_zip_line(line):
-                return line.strip(), True
+        if features.city_state_zip:
+            return features.line, True
         return None, False
     except Exception as e:
         error = f"Error parsing citystatezip: {e}"
@@ -347,12 +851,10 @@ def parse_citystatezip(line: str) -> Tuple[str, bool]:
         return None, False
 
 
-def parse_contact(line: str) -> Tuple[str, bool]:
+def parse_contact(features: LineFeatures) -> Tuple[str, bool]:
     try:
-        if isinstance(line, str) and not None:
-            if (not contains_email_address(line) and not contains_phone_number(line) and
-                    not starts_with_invoice_or_purchase(line)):
-                return line.strip(), True
+        if not features.email and not features.phone and not features.invoice_or_purchase:
+            return features.line, True
         return None, False
     except Exception as e:
         error = f"Error parsing contact: {e}"
@@ -360,33 +862,52 @@ def parse_contact(line: str) -> Tuple[str, bool]:
         return None, False
 
 
-def parse_department(line: str) -> Tuple[Optional[str], bool]:
+def parse_date_match(match: re.Match, current_year: int) -> Optional[datetime]:
+    if match.group('month_name'):
+        year = int(match.group('year'))
+    else:
+        year = int(match.group('short_year'))
+        if len(match.group('short_year')) == 2:
+            year += 1900 if year >= 69 else 2000
+    if abs(year - current_year) > YEAR_RANGE:
+        return None
+
     try:
-        if is_department_line(line):
-            return line.strip(), True
-        else:
-            return None, False
-    except Exception as e:
-        error = f"Error parsing department: {e}"
-        log(error, "ERROR")
-        return None, False
+        if match.group('month_name'):
+            month = MONTHS.index(match.group('month_name')) + 1
+            return datetime(year, month, int(match.group('day')))
+        return datetime(
+            year, int(match.group('month')), int(match.group('short_day')))
+    except ValueError:
+        pass
+
+    # Not a valid date in the expected order (e.g. 13/05/2024): let dateutil
+    # have a go before giving up on this match.
+    try:
+        from dateutil import parser
 
+        return parser.parse(match.group(0).strip(), fuzzy=True)
+    except (ValueError, OverflowError):
+        log(f"Error parsing date: {match.group(0).strip()}", "WARNING")
+        return None
 
-def parse_email(line: str) -> Tuple[str, bool]:
+
+def parse_department(features: LineFeatures) -> Tuple[Optional[str], bool]:
     try:
-        if contains_email_address(line):
-            return isolate_email(line), True
-        return None, False
+        if features.department:
+            return features.line, True
+        else:
+            return None, False
     except Exception as e:
-        error = f"Error parsing email: {e}"
+        error = f"Error parsing department: {e}"
         log(error, "ERROR")
         return None, False
 
 
-def parse_email(line: str) -> Tuple[str, bool]:
+def parse_email(features: LineFeatures) -> Tuple[str, bool]:
     try:
-        if "@" in line:
-            email = line.strip().split()[-1]
+        if "@" in features.line:
+            email = features.line.split()[-1]
             return email, True
         return None, False
     except Exception as e:
@@ -395,62 +916,43 @@ def parse_email(line: str) -> Tuple[str, bool]:
         return None, False
 
 
-def parse_freight(lines: List[str], start_index: int) -> Dict:
+def parse_freight(line: str) -> Tuple[str, bool]:
     try:
-        data = {}
-        for line in lines[start_index:]:
-            if line.startswith("Freight"):
-                if ":" in line:
-                    data['Freight'] = clean_currency(
-                        line.split(":")[1].strip())
-                    break
-                else:
-                    data['Freight'] = clean_currency(
-                        line.split("Freight")[1].strip())
-                    break
-        return data
+        if line.startswith("Freight"):
+            if ":" in line:
+                return clean_currency(line.split(":")[1].strip()), True
+            else:
+                return clean_currency(line.split("Freight")[1].strip()), True
+        return None, False
     except Exception as e:
         error = f"Error parsing freight: {e}"
         log(error, "ERROR")
-        return {}
+        return None, False
 
 
-def parse_invoice_and_purchase_order(lines: List[str], start_index: int) -> Dict:
+def parse_invoice_and_purchase_order(line: str) -> Tuple[Tuple[str, str], bool]:
     try:
-        data = {}
-        invoice, po = None, None
-        invoice_line, po_line = None, None
-        for line in lines[start_index:]:
-            if line.startswith("Invoice") and not invoice:
-                invoice = line.split(":")[1].strip()
-                data['Invoice'] = invoice
-                invoice_line = lines.index(line)
-            if line.startswith("Purchase") and not po:
-                po = line.split(":")[1].strip()
-                data['Purchase Order'] = po
-                po_line = lines.index(line)
-            if invoice and po:
-                break
-        return_line = ((invoice_line if invoice_line > po_line else po_line)
-                       if invoice_line and po_line else start_index)
-        return data, return_line
+        if ":" in line:
+            if line.startswith("Invoice"):
+                return ('Invoice', line.split(":")[1].strip()), True
+            if line.startswith("Purchase"):
+                return ('Purchase Order', line.split(":")[1].strip()), True
+        return None, False
     except Exception as e:
         error = f"Error parsing invoice and purchase order: {e}"
         log(error, "ERROR")
-        return {}
+        return None, False
 
 
-def parse_phone(line: str) -> Tuple[Dict[str, str], bool]:
+def parse_phone(
+        line: str, settings: Optional[Settings] = None) -> Tuple[Dict[str, str], bool]:
     try:
-        tel_array = os.getenv(
-            'MAIN_PHONE', json.dumps(['Tel', 'Main', 'Home', 'Office', 'Phone', 'Telephone']))
-        cell_array = os.getenv('CELL_PHONE', json.dumps(
-            ['Cell', 'Mobile', 'iPhone']))
-        keys = {"Tel": json.loads(tel_array), "Cell": json.loads(cell_array)}
+        if settings is None:
+            settings = get_settings()
         phone_data = {}
-        for key, prefixes in keys.items():
-            if any(line.startswith(prefix) for prefix in prefixes):
-                match = re.search(r'\d{3}[-.\s]?\d{3}[-.\s]?\d{4}', line)
+        for key, prefixes in (("Tel", settings.main_phone), ("Cell", settings.cell_phone)):
+            if prefixes and line.startswith(prefixes):
+                match = PHONE_DIGITS_PATTERN.search(line)
                 if match:
                     phone_data[key] = match.group(0)
                     return phone_data, True
@@ -461,63 +963,331 @@ def parse_phone(line: str) -> Tuple[Dict[str, str], bool]:
         return None, False
 
 
-def parse_products(lines: List[str], start_index: int) -> List[Dict]:
-    data = []
-    all_products = False
-    product_header = None
+def parse_product(line: str) -> Tuple[Product, bool]:
     try:
-        product_header = find_header_fill_index(lines, start_index)
-
-        if product_header is None:
-            log("Product header not found", "ERROR")
-            return [], None
-
-        while not all_products:
-            for line in lines[product_header+1:]:
-                product_data = line.split(" ")
-                product_data = list(filter(None, product_data))
-                if len(product_data) >= 4:
-                    product_name, per_price, quantity, total_price = " ".join(
-                        product_data[:-3]), product_data[-3], product_data[-2], product_data[-1]
-                    data.append({
-                        'Product_Description': product_name,
-                        'Price_Per_Product': clean_currency(per_price),
-                        'Quantity': clean_currency(quantity),
-                        'Total_Price': clean_currency(total_price)
-                    })
-                if line.startswith("Freight"):
-                    freight_line = lines.index(line)
-                    all_products = True
-                    break
-        return data, freight_line
+        product_data = line.split()
+        if len(product_data) >= 4:
+            product_name, per_price, quantity, total_price = " ".join(
+                product_data[:-3]), product_data[-3], product_data[-2], product_data[-1]
+            return (
+                product_name,
+                clean_currency(per_price),
+                clean_currency(quantity),
+                clean_currency(total_price),
+            ), True
+        return None, False
     except Exception as e:
-        error = f"Error parsing products: {e}"
+        error = f"Error parsing product: {e}"
         log(error, "ERROR")
-        return [], None
+        return None, False
 
 
-def pdf_to_excel(pdf_path, excel_path) -> bool:
+def parse_sections(lines: List[str], settings: Settings) -> Invoice:
+    # One forward pass: date -> main section -> products -> freight. Every
+    # line is visited once and the loop always ends at the last line. Known
+    # layouts go through their template instead; if its rules do not fit
+    # this document, the generic pass below still runs.
+    date_data, date_index = find_and_parse_date(lines)
+    match = identify_template(lines, get_templates(settings.templates_path))
+    if match is not None:
+        invoice = parse_template_sections(lines, *match, date_index, settings)
+        if invoice is not None:
+            invoice.date = date_data.get('Date')
+            return invoice
+
+    invoice = Invoice()
+    invoice.date = date_data.get('Date')
+    main_start = 0 if date_index is None else date_index + 1
+
+    state = SECTION_MAIN
+    for index in range(main_start, len(lines)):
+        line = lines[index]
+
+        reference, success = parse_invoice_and_purchase_order(line)
+        if success:
+            invoice.set_reference(*reference)
+            continue
+
+        if state == SECTION_MAIN:
+            if is_product_header(line):
+                parse_main_section(lines, main_start, index, settings, invoice)
+                state = SECTION_PRODUCTS
+        elif state == SECTION_PRODUCTS:
+            # The header is repeated at the top of each continuation page.
+            if is_product_header(line):
+                continue
+            freight, success = parse_freight(line)
+            if success:
+                invoice.freight = freight
+                state = SECTION_TRAILER
+                continue
+            product, success = parse_product(line)
+            if success:
+                invoice.products.append(product)
+
+    if state == SECTION_MAIN:
+        log("Product header not found", "ERROR")
+        parse_main_section(lines, main_start, len(lines), settings, invoice)
+
+    return invoice
+
+
+def parse_template_sections(
+        lines: List[str], template: Template, header_index: int,
+        date_index: Optional[int], settings: Settings) -> Optional[Invoice]:
+    # Main-section lines are matched to the template's rules in order, with
+    # no per-line classification. Returns None when a required rule does not
+    # match, a line is left over or a value cannot be parsed.
+    if date_index is None or header_index <= date_index:
+        return None
+    invoice = Invoice()
+    index = date_index + 1
+    for rule in template.main:
+        matched = False
+        while index < header_index and rule.pattern.search(lines[index]):
+            line = lines[index].strip()
+            if rule.field == 'contact':
+                invoice.contacts.append(line)
+            elif rule.field == 'phone':
+                phone, success = parse_phone(line, settings)
+                if not success:
+                    return None
+                invoice.phone = phone
+            elif rule.field == 'email':
+                invoice.email = line.split()[-1]
+            else:
+                setattr(invoice, rule.field, line)
+            index += 1
+            matched = True
+            if not rule.repeat:
+                break
+        if not matched and not rule.optional:
+            return None
+    if index != header_index:
+        return None
+
+    in_products = True
+    for line in lines[header_index + 1:]:
+        reference, success = parse_invoice_and_purchase_order(line)
+        if success:
+            invoice.set_reference(*reference)
+            continue
+        if not in_products or is_product_header(line):
+            continue
+        freight, success = parse_freight(line)
+        if success:
+            invoice.freight = freight
+            in_products = False
+            continue
+        if template.product is None:
+            product, success = parse_product(line)
+            if success:
+                invoice.products.append(product)
+            continue
+        match = template.product.match(line.strip())
+        if match:
+            description, price, quantity, total = match.group(*PRODUCT_GROUPS)
+            invoice.products.append((
+                ' '.join(description.split()), clean_currency(price),
+                clean_currency(quantity), clean_currency(total)))
+    return invoice
+
+
+def pdf_to_excel(
+        pdf_path, excel_path, settings: Optional[Settings] = None,
+        timings: Optional[Stage_Timings] = None, sha256: Optional[str] = None) -> bool:
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            page = pdf.pages[0]
-            text = page.extract_text()
+        if settings is None:
+            settings = get_settings()
+
+        text = extract_pdf_text(pdf_path, settings, timings, sha256)
 
-        df = map_text_to_excel_columns(text)
+        with span(timings, 'map'):
+            invoice = map_text_to_invoice(text, settings)
+            if invoice is None or invoice.is_empty():
+                raise Exception("Error mapping text to excel columns!")
 
-        if df.empty:
-            raise Exception("Error mapping text to excel columns!")
+        if write_row(pdf_path, excel_path, invoice, settings, timings):
+            return True
         else:
-            df.to_excel(excel_path, index=False)
-            if format_excel(excel_path):
-                return True
-            else:
-                raise Exception("Error formatting excel!")
+            raise Exception("Error writing excel!")
     except Exception as e:
         error = f"Error converting pdf [{pdf_path}] -> {excel_path}: {e}"
         log(error, "ERROR")
         return False
 
 
+def pdf_to_invoice(
+        pdf_path: str, settings: Optional[Settings] = None,
+        timings: Optional[Stage_Timings] = None,
+        sha256: Optional[str] = None) -> Optional[Invoice]:
+    try:
+        text = extract_pdf_text(pdf_path, settings, timings, sha256)
+        with span(timings, 'map'):
+            invoice = map_text_to_invoice(text, settings)
+            if invoice is None or invoice.is_empty():
+                raise Exception("Error mapping text to excel columns!")
+        return invoice
+    except Exception as e:
+        error = f"Error converting pdf [{pdf_path}]: {e}"
+        log(error, "ERROR")
+        return None
+
+
+def put_unless_stopped(target: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    # Bounded queues fill up when their consumer is gone; a cancelled
+    # pipeline drops the item instead of blocking forever.
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=QUEUE_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def read_invoice_pages(pages: Iterable[str]) -> str:
+    return '\n'.join(collect_invoice_pages(pages))
+
+
+def record_conversion(
+        manifests: Dict[str, Manifest], pdf_path: str, excel_path: str,
+        converted: bool, sha256: Optional[str] = None) -> Optional[Dict]:
+    report_conversion(pdf_path, excel_path, converted)
+    manifest = manifests[os.path.dirname(excel_path)]
+    if converted:
+        return record_file(manifest, pdf_path, excel_path, sha256)
+    remove_file(manifest, pdf_path)
+    return None
+
+
+def report_conversion(pdf_path: str, excel_path: str, converted: bool) -> None:
+    pdf_file = os.path.basename(pdf_path)
+    try:
+        if converted:
+            success = f"Processed {pdf_file} -> {excel_path}"
+            log(success, "INFO", True)
+        else:
+            if os.path.exists(excel_path):
+                # Output is atomic, so this is the previous run's complete file.
+                kept = f"Failed {pdf_file}; kept previous {excel_path}"
+                log(kept, "ERROR")
+            else:
+                raise Exception(
+                    "Error processing pdf to excel!")
+    except Exception as e:
+        error = f"Error processing {pdf_file} -> {e}"
+        log(error, "ERROR")
+
+
+def report_duplicate(
+        report: Optional[RunReport], dedup: DedupIndex, pdf_path: str, skipped: bool) -> None:
+    duplicate = dedup.duplicate_of(pdf_path)
+    if duplicate is None:
+        return
+    kind, original = duplicate
+    if report is not None:
+        report.add_duplicate(pdf_path, kind, original, skipped)
+    relative_path = dedup.relative(pdf_path)
+    reason = 'identical to' if kind == KIND_IDENTICAL else 'same invoice and purchase order as'
+    if skipped:
+        log(f"Skipped duplicate {relative_path}: {reason} {original}", "INFO", True)
+    else:
+        log(f"Possible duplicate {relative_path}: {reason} {original}", "WARNING")
+
+
+def report_stopped(isolated: IsolatedResult, settings: Settings) -> str:
+    # Returns the stage the file was stuck in.
+    stage = failed_stage(isolated.timings, get_file_stages(settings))
+    error = (f"Stopped {os.path.basename(isolated.job[0])}: {isolated.outcome} at {stage} "
+             f"after {isolated.seconds:.1f}s, quarantined")
+    log(error, "ERROR")
+    return stage
+
+
+def start_journal(
+        target_dir: str, settings: Settings,
+        manifests: Dict[str, Manifest]) -> Optional[Journal]:
+    # With settings.resume, the PDFs an interrupted run already converted are
+    # put back into their manifests, so discovery skips them as unchanged
+    # (and redoes any that changed since). The journal is then appended to.
+    journal_path = os.path.join(target_dir, settings.processed_dir, JOURNAL_NAME)
+    version = get_manifest_version(settings)
+    resumed = load_journal(journal_path, version) if settings.resume else None
+    if settings.resume and resumed is None:
+        log(f"No interrupted run to resume in {target_dir}", "INFO", True)
+    for pdf_file, entry in (resumed or {}).items():
+        pdf_path = os.path.join(target_dir, pdf_file)
+        processed_folder = os.path.dirname(get_output_path(pdf_path, settings))
+        if processed_folder not in manifests:
+            manifests[processed_folder] = load_manifest(processed_folder, version)
+        restore_file(manifests[processed_folder], pdf_path, entry)
+    if resumed:
+        log(f"Resuming: {len(resumed)} PDF(s) already converted in {target_dir}", "INFO", True)
+    return open_journal(journal_path, version, append=resumed is not None)
+
+
 def starts_with_invoice_or_purchase(line: str) -> bool:
     lower_line = line.lower()
     return lower_line.startswith(('invoice', 'purchase'))
+
+
+def write_row(
+        pdf_path: str, excel_path: str, invoice: Invoice, settings: Settings,
+        timings: Optional[Stage_Timings] = None) -> bool:
+    # Every format is written straight from the record; no DataFrame is built.
+    if settings.schema == 'normalized':
+        return write_tables(pdf_path, excel_path, invoice, settings, timings)
+    columns, rows = invoice.columns(), [invoice.values()]
+    if settings.output_format == 'csv':
+        return write_csv(excel_path, columns, rows, timings)
+    if settings.output_format == 'jsonl':
+        return write_jsonl(excel_path, columns, rows, timings)
+    return write_excel(excel_path, columns, rows, settings, timings)
+
+
+def write_stage(
+        write_queue: queue.Queue, results: queue.Queue, settings: Settings,
+        stop: threading.Event) -> None:
+    # Runs in a thread so workbook writes overlap with extraction and mapping.
+    # Output folders are created here, once each, so folders whose PDFs all
+    # fail are left alone.
+    created = set()
+    try:
+        while True:
+            item = get_unless_stopped(write_queue, stop)
+            if item is None:
+                break
+            pdf_path, excel_path, invoice, timings, sha256 = item
+            processed_folder = os.path.dirname(excel_path)
+            if processed_folder not in created:
+                try:
+                    os.makedirs(processed_folder, exist_ok=True)
+                    created.add(processed_folder)
+                except OSError as e:
+                    log(f"Error creating {processed_folder}: {e}", "ERROR")
+            converted = write_row(pdf_path, excel_path, invoice, settings, timings)
+            status = STATUS_CONVERTED if converted else STATUS_FAILED
+            put_unless_stopped(results, ConversionResult(
+                pdf_path, excel_path, status, timings, invoice, sha256), stop)
+    except Exception as e:
+        put_unless_stopped(results, e, stop)
+        while get_unless_stopped(write_queue, stop) is not None:
+            pass
+    finally:
+        put_unless_stopped(results, None, stop)
+
+
+def write_tables(
+        pdf_path: str, excel_path: str, invoice: Invoice, settings: Settings,
+        timings: Optional[Stage_Timings] = None) -> bool:
+    writer = TableWriter(excel_path, TABLES, settings)
+    try:
+        with span(timings, 'write'):
+            add_invoice_rows(writer, invoice, os.path.basename(pdf_path))
+            return writer.close()
+    except Exception as e:
+        writer.close()
+        error = f"Error writing tables -> {excel_path}: {e}"
+        log(error, "ERROR")
+        return False
@@ -0,0 +1,67 @@
+import os
+
+from typing import Dict
+
+from core.filer import load_json, save_json
+from core.logger import zlog as log
+
+
+# PDFs that blew their time or memory budget (or killed their worker), keyed
+# by path relative to the target folder. They are skipped by later runs
+# until they change on disk or the run is forced.
+QUARANTINE_NAME = 'quarantine.json'
+
+Quarantine = Dict[str, Dict]
+
+
+def is_quarantined(quarantine: Quarantine, pdf_file: str, pdf_path: str) -> bool:
+    entry = quarantine['files'].get(pdf_file)
+    if entry is None:
+        return False
+    try:
+        stat = os.stat(pdf_path)
+    except OSError:
+        return False
+    return entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+
+
+def load_quarantine(quarantine_path: str) -> Quarantine:
+    quarantine = load_json(quarantine_path, 'quarantine list')
+    if quarantine is None:
+        return {'files': {}, 'dirty': False}
+    quarantine.setdefault('files', {})
+    quarantine['dirty'] = False
+    return quarantine
+
+
+def quarantine_file(
+        quarantine: Quarantine, pdf_file: str, pdf_path: str,
+        reason: str, stage: str) -> None:
+    try:
+        stat = os.stat(pdf_path)
+    except OSError as e:
+        error = f"Error quarantining {pdf_path}: {e}"
+        log(error, "WARNING")
+        return
+    quarantine['files'][pdf_file] = {
+        'reason': reason,
+        'stage': stage,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    }
+    quarantine['dirty'] = True
+
+
+def release_file(quarantine: Quarantine, pdf_file: str) -> None:
+    if quarantine['files'].pop(pdf_file, None) is not None:
+        quarantine['dirty'] = True
+
+
+def save_quarantine(quarantine_path: str, quarantine: Quarantine) -> bool:
+    if not quarantine.get('dirty'):
+        return True
+    data = {key: value for key, value in quarantine.items() if key != 'dirty'}
+    if not save_json(quarantine_path, data, 'quarantine list'):
+        return False
+    quarantine['dirty'] = False
+    return True
@@ -0,0 +1,155 @@
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Slot -> column name, in output order. Contacts, products and freight are
+# laid out separately (numbered columns, then freight last).
+HEADER_COLUMNS = (
+    ('date', 'Date'),
+    ('address_1', 'Address 1'),
+    ('address_2', 'Address 2'),
+    ('city_state_zip', 'City, State, Zip'),
+)
+DETAIL_COLUMNS = (
+    ('phone', 'Phone'),
+    ('email', 'Email'),
+)
+REFERENCE_COLUMNS = (
+    ('invoice', 'Invoice'),
+    ('purchase_order', 'Purchase Order'),
+)
+REFERENCE_SLOTS = {column: slot for slot, column in REFERENCE_COLUMNS}
+PRODUCT_COLUMNS = ('Product_Description', 'Price_Per_Product', 'Quantity', 'Total_Price')
+
+# The normalized schema: one invoices row per PDF and one line_items row per
+# product, joined on Invoice (and Source File, for invoices without a number).
+# Every file gets the same columns however many products it has.
+INVOICE_TABLE = 'invoices'
+LINE_ITEM_TABLE = 'line_items'
+INVOICE_TABLE_COLUMNS = (
+    'Invoice', 'Purchase Order', 'Source File', 'Date', 'Address 1', 'Address 2',
+    'City, State, Zip', 'Contacts', 'Phone Type', 'Phone', 'Email', 'Freight',
+    'Line Items')
+LINE_ITEM_TABLE_COLUMNS = ('Invoice', 'Source File', 'Line') + PRODUCT_COLUMNS
+TABLES = {
+    INVOICE_TABLE: INVOICE_TABLE_COLUMNS,
+    LINE_ITEM_TABLE: LINE_ITEM_TABLE_COLUMNS,
+}
+
+Product = Tuple[str, str, str, str]
+
+
+class Invoice:
+    # One parsed invoice: header fields in slots and the line items as plain
+    # (description, price, quantity, total) tuples. Writers read columns()
+    # and values() directly; nothing builds a dict or DataFrame per invoice.
+    __slots__ = (
+        'date', 'address_1', 'address_2', 'city_state_zip', 'contacts',
+        'phone', 'email', 'invoice', 'purchase_order', 'products', 'freight')
+
+    def __init__(self):
+        self.date: Optional[str] = None
+        self.address_1: Optional[str] = None
+        self.address_2: Optional[str] = None
+        self.city_state_zip: Optional[str] = None
+        self.contacts: List[str] = []
+        self.phone: Optional[Dict[str, str]] = None
+        self.email: Optional[str] = None
+        self.invoice: Optional[str] = None
+        self.purchase_order: Optional[str] = None
+        self.products: List[Product] = []
+        self.freight: Optional[str] = None
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Invoice):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __getstate__(self) -> Tuple:
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state: Tuple) -> None:
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+    def __repr__(self) -> str:
+        return f"Invoice(invoice={self.invoice!r}, date={self.date!r}, products={len(self.products)})"
+
+    def columns(self) -> List[str]:
+        return [column for column, _ in self.items()]
+
+    def invoice_row(self, source_file: str) -> List[Any]:
+        phone_type, phone = next(iter((self.phone or {None: None}).items()))
+        return [
+            self.invoice, self.purchase_order, source_file, self.date,
+            self.address_1, self.address_2, self.city_state_zip,
+            '; '.join(self.contacts) or None, phone_type, phone, self.email,
+            to_number(self.freight), len(self.products),
+        ]
+
+    def is_empty(self) -> bool:
+        return next(iter(self.items()), None) is None
+
+    def items(self) -> Iterable[Tuple[str, Any]]:
+        # Only fields that were found, in the same layout the mapped dict has
+        # always had: address, contacts, phone / email, references, products,
+        # freight.
+        for slot, column in HEADER_COLUMNS:
+            value = getattr(self, slot)
+            if value is not None:
+                yield column, value
+        for number, contact in enumerate(self.contacts, start=1):
+            yield f'Contact {number}', contact
+        for slot, column in DETAIL_COLUMNS + REFERENCE_COLUMNS:
+            value = getattr(self, slot)
+            if value is not None:
+                yield column, value
+        for index, product in enumerate(self.products):
+            for column, value in zip(PRODUCT_COLUMNS, product):
+                yield f"{column}_{index}", value
+        if self.freight is not None:
+            yield 'Freight', self.freight
+
+    def line_item_rows(self, source_file: str) -> Iterator[List[Any]]:
+        for line, (description, price, quantity, total) in enumerate(self.products, start=1):
+            yield [
+                self.invoice, source_file, line, description,
+                to_number(price), to_number(quantity), to_number(total),
+            ]
+
+    def set_reference(self, column: str, value: str) -> None:
+        # The first Invoice / Purchase Order reference wins.
+        slot = REFERENCE_SLOTS[column]
+        if getattr(self, slot) is None:
+            setattr(self, slot, value)
+
+    def to_row(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def values(self) -> List[Any]:
+        return [value for _, value in self.items()]
+
+
+def to_dataframe(invoices: Iterable[Invoice]) -> 'pd.DataFrame':
+    # For analysis only; conversions never build DataFrames.
+    import pandas as pd
+
+    return pd.DataFrame([invoice.to_row() for invoice in invoices])
+
+
+def to_number(value: Optional[str]) -> Union[int, float, str, None]:
+    # Cleaned currency text ('$1234.50', '3') -> a number. Anything that still
+    # is not numeric is kept as text rather than dropped.
+    if not value:
+        return None
+    text = value.lstrip('$')
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return value
@@ -0,0 +1,91 @@
+import fnmatch
+import os
+
+from typing import Iterator, List, NamedTuple, Tuple
+
+from core.logger import get_log_dir
+from core.logger import zlog as log
+from core.settings import Settings
+
+
+PDF_EXTENSION = '.pdf'
+
+
+class ScannedFile(NamedTuple):
+    path: str
+    relative_path: str
+    size: int
+
+
+def is_excluded(relative_path: str, settings: Settings) -> bool:
+    return any(fnmatch.fnmatch(relative_path, pattern) for pattern in settings.exclude)
+
+
+def is_included(relative_path: str, settings: Settings) -> bool:
+    if not settings.include:
+        return True
+    name = os.path.basename(relative_path)
+    return any(
+        fnmatch.fnmatch(relative_path, pattern) or fnmatch.fnmatch(name, pattern)
+        for pattern in settings.include)
+
+
+def is_pdf(name: str) -> bool:
+    return name.lower().endswith(PDF_EXTENSION)
+
+
+def is_pruned(name: str, path: str, settings: Settings, log_dir: str) -> bool:
+    # Output folders (ours, wherever they are in the tree) and the log folder
+    # never hold PDFs to convert.
+    return name == settings.processed_dir or os.path.realpath(path) == log_dir
+
+
+def iter_pdfs(target_dir: str, settings: Settings) -> Iterator[ScannedFile]:
+    # Depth-first os.scandir walk. Each directory is listed once, its entries
+    # carry their type (and size, from one stat) without extra lookups, and
+    # pruned folders are never opened. Globs match the path relative to
+    # target_dir with '/' separators; include globs may also match the name.
+    log_dir = os.path.realpath(get_log_dir())
+    stack: List[Tuple[str, str, int]] = [(target_dir, '', 0)]
+    while stack:
+        directory, relative_dir, depth = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError as e:
+            error = f"Error scanning {directory}: {e}"
+            log(error, "WARNING")
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            relative_path = f"{relative_dir}{entry.name}"
+            try:
+                # Symlinked directories are not followed so a link loop cannot recurse.
+                if entry.is_dir(follow_symlinks=False):
+                    if settings.max_depth is not None and depth >= settings.max_depth:
+                        continue
+                    if is_pruned(entry.name, entry.path, settings, log_dir):
+                        continue
+                    if is_excluded(relative_path, settings):
+                        continue
+                    subdirectories.append((entry.path, f"{relative_path}/", depth + 1))
+                elif is_pdf(entry.name) and entry.is_file():
+                    if is_included(relative_path, settings) and not is_excluded(
+                            relative_path, settings):
+                        yield ScannedFile(entry.path, relative_path, entry.stat().st_size)
+            except OSError as e:
+                error = f"Error scanning {entry.path}: {e}"
+                log(error, "WARNING")
+        stack.extend(reversed(subdirectories))
+
+
+def scan_pdfs(
+        target_dir: str, settings: Settings,
+        largest_first: bool = False) -> List[ScannedFile]:
+    # Path order by default. largest_first hands the slowest files to the
+    # worker pool first, so a big PDF does not hold up the end of a run.
+    pdfs = list(iter_pdfs(target_dir, settings))
+    if largest_first:
+        pdfs.sort(key=lambda pdf: pdf.size, reverse=True)
+    return pdfs
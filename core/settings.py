@@ -0,0 +1,164 @@
+import json
+import os
+
+from dataclasses import dataclass, fields, replace
+from dotenv import load_dotenv
+from typing import Any, Dict, Optional, Tuple
+
+from core.logger import zlog as log
+
+
+@dataclass(frozen=True)
+class Settings:
+    cache_max_mb: int = 1024
+    cache_path: Optional[str] = None
+    cache_words: bool = False
+    cell_phone: Tuple[str, ...] = ('Cell', 'Mobile', 'iPhone')
+    consolidated_path: Optional[str] = None
+    dedup: str = 'flag'
+    exclude: Tuple[str, ...] = ()
+    extractor: str = 'pdfplumber'
+    file_memory_mb: int = 0
+    file_timeout: float = 120.0
+    force: bool = False
+    header_fill: Tuple[str, str, str] = ('4CAF50', '4CAF50', 'solid')
+    include: Tuple[str, ...] = ()
+    main_phone: Tuple[str, ...] = (
+        'Tel', 'Main', 'Home', 'Office', 'Phone', 'Telephone')
+    max_depth: Optional[int] = None
+    output_format: str = 'xlsx'
+    processed_dir: str = 'processed'
+    report_path: Optional[str] = None
+    resume: bool = False
+    schema: str = 'wide'
+    sheet_per_directory: bool = False
+    templates_path: Optional[str] = None
+    worker_max_files: int = 200
+    workers: int = os.cpu_count() or 1
+
+
+# Environment variable -> Settings field. Values are strings; lists may be
+# given as JSON arrays or comma separated.
+ENVIRONMENT_KEYS = {
+    'DEDUP': 'dedup',
+    'EXTRACT_CACHE': 'cache_path',
+    'EXTRACT_CACHE_MAX_MB': 'cache_max_mb',
+    'EXTRACT_CACHE_WORDS': 'cache_words',
+    'EXTRACTOR': 'extractor',
+    'CELL_PHONE': 'cell_phone',
+    'FILE_MEMORY_MB': 'file_memory_mb',
+    'FILE_TIMEOUT': 'file_timeout',
+    'HEADER_FILL': 'header_fill',
+    'MAIN_PHONE': 'main_phone',
+    'MAX_DEPTH': 'max_depth',
+    'OUTPUT_FORMAT': 'output_format',
+    'OUTPUT_SCHEMA': 'schema',
+    'PROCESSED_DIR': 'processed_dir',
+    'RUN_REPORT': 'report_path',
+    'SCAN_EXCLUDE': 'exclude',
+    'SCAN_INCLUDE': 'include',
+    'TEMPLATES': 'templates_path',
+    'WORKER_MAX_FILES': 'worker_max_files',
+    'WORKERS': 'workers',
+}
+
+# off: convert every copy. flag: skip byte-identical copies, convert but report
+# PDFs repeating an invoice number / purchase order. skip: skip both.
+DEDUP_MODES = ('off', 'flag', 'skip')
+# The keys of core.extract.EXTRACTORS, listed here so loading settings does
+# not import the PDF libraries.
+EXTRACTOR_NAMES = ('pdfplumber', 'pdfminer')
+OUTPUT_FORMATS = ('xlsx', 'csv', 'jsonl')
+# wide: one row per invoice with numbered product columns. normalized: fixed
+# invoices and line_items tables.
+SCHEMAS = ('wide', 'normalized')
+
+SETTING_TYPES = {field.name: field.type for field in fields(Settings)}
+
+_default_settings: Optional[Settings] = None
+
+
+def coerce_value(name: str, value: Any) -> Any:
+    default = getattr(Settings, name)
+    if isinstance(default, tuple):
+        if isinstance(value, str):
+            value = value.strip()
+            value = json.loads(value) if value.startswith('[') else value.split(',')
+        return tuple(str(item).strip() for item in value if str(item).strip())
+    if isinstance(default, bool):
+        if isinstance(value, str):
+            return value.strip().lower() in ('1', 'true', 'yes', 'on')
+        return bool(value)
+    if isinstance(default, float):
+        return float(value)
+    if isinstance(default, int) or SETTING_TYPES[name] == Optional[int]:
+        return int(value)
+    return value
+
+
+def get_settings() -> Settings:
+    global _default_settings
+    if _default_settings is None:
+        _default_settings = load_settings()
+    return _default_settings
+
+
+def load_settings(overrides: Optional[Dict[str, Any]] = None) -> Settings:
+    load_dotenv()
+    values: Dict[str, Any] = {}
+    try:
+        for key, name in ENVIRONMENT_KEYS.items():
+            if os.getenv(key):
+                values[name] = coerce_value(name, os.getenv(key))
+        known = {field.name for field in fields(Settings)}
+        for name, value in (overrides or {}).items():
+            if name not in known:
+                raise ValueError(f"unknown setting '{name}'")
+            if value is not None:
+                values[name] = coerce_value(name, value)
+        settings = replace(Settings(), **values)
+    except Exception as e:
+        error = f"Error loading settings: {e}"
+        log(error, "FATAL")
+        raise ValueError(error)
+    validate_settings(settings)
+    return settings
+
+
+def validate_settings(settings: Settings) -> None:
+    problems = []
+    if not settings.cell_phone and not settings.main_phone:
+        problems.append("CELL_PHONE and MAIN_PHONE are both empty")
+    if len(settings.header_fill) != 3:
+        problems.append(
+            "HEADER_FILL needs exactly three values (start color, end color, fill type)")
+    if not settings.processed_dir or os.path.isabs(settings.processed_dir):
+        problems.append("PROCESSED_DIR must be a relative directory name")
+    if settings.dedup not in DEDUP_MODES:
+        problems.append(f"DEDUP must be one of {', '.join(DEDUP_MODES)}")
+    if settings.extractor not in EXTRACTOR_NAMES:
+        problems.append(f"EXTRACTOR must be one of {', '.join(EXTRACTOR_NAMES)}")
+    if settings.output_format not in OUTPUT_FORMATS:
+        problems.append(f"OUTPUT_FORMAT must be one of {', '.join(OUTPUT_FORMATS)}")
+    if settings.schema not in SCHEMAS:
+        problems.append(f"OUTPUT_SCHEMA must be one of {', '.join(SCHEMAS)}")
+    elif settings.schema == 'normalized' and settings.sheet_per_directory:
+        problems.append("one sheet per directory needs the wide schema")
+    if settings.resume and settings.force:
+        problems.append("a forced run cannot resume; files it already converted would be redone")
+    if settings.cache_max_mb < 1:
+        problems.append("EXTRACT_CACHE_MAX_MB must be at least 1")
+    if settings.max_depth is not None and settings.max_depth < 0:
+        problems.append("MAX_DEPTH must be 0 (the folder itself) or more")
+    if settings.file_timeout < 0:
+        problems.append("FILE_TIMEOUT must be 0 (no limit) or more seconds")
+    if settings.file_memory_mb < 0:
+        problems.append("FILE_MEMORY_MB must be 0 (no limit) or more")
+    if settings.worker_max_files < 1:
+        problems.append("WORKER_MAX_FILES must be at least 1")
+    if settings.workers < 1:
+        problems.append("workers must be at least 1")
+    if problems:
+        error = f"Invalid settings: {'; '.join(problems)}"
+        log(error, "FATAL")
+        raise ValueError(error)
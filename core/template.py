@@ -0,0 +1,125 @@
+import hashlib
+import json
+import re
+
+from typing import Any, Dict, List, NamedTuple, Optional, Pattern, Tuple
+
+from core.logger import zlog as log
+
+
+# Fields a main-section rule can fill. 'contact' appends to the contacts.
+TEMPLATE_FIELDS = ('address_1', 'address_2', 'city_state_zip', 'contact', 'phone', 'email')
+PRODUCT_GROUPS = ('description', 'price', 'quantity', 'total')
+
+# Where the product header may sit when a template does not say.
+HEADER_LINES = (0, 40)
+
+_registries: Dict[str, Tuple['Template', ...]] = {}
+_versions: Dict[str, str] = {}
+
+
+class LineRule(NamedTuple):
+    field: str
+    pattern: Pattern
+    optional: bool
+    repeat: bool
+
+
+class Template(NamedTuple):
+    # One known invoice layout, compiled from templates.json. The fingerprint
+    # is the product header text, the line range it must appear in and
+    # optional patterns for fixed lines (e.g. the vendor name on line 0).
+    # main holds the main-section lines between the date and the header, in
+    # order; product, if given, splits one product line into PRODUCT_GROUPS
+    # (otherwise the last three words are price, quantity and total).
+    name: str
+    header: str
+    header_lines: Tuple[int, int]
+    lines: Tuple[Tuple[int, Pattern], ...]
+    main: Tuple[LineRule, ...]
+    product: Optional[Pattern]
+
+
+def compile_template(data: Dict[str, Any]) -> Template:
+    name = data['name']
+    fingerprint = data['fingerprint']
+    main = []
+    for rule in data['main']:
+        if rule['field'] not in TEMPLATE_FIELDS:
+            raise ValueError(f"template '{name}': unknown field '{rule['field']}'")
+        main.append(LineRule(
+            rule['field'], re.compile(rule['pattern']),
+            bool(rule.get('optional', False)), bool(rule.get('repeat', False))))
+    product = re.compile(data['product']) if data.get('product') else None
+    missing = set(PRODUCT_GROUPS) - set(product.groupindex) if product else set()
+    if missing:
+        raise ValueError(
+            f"template '{name}': product pattern needs groups {', '.join(sorted(missing))}")
+    header_lines = tuple(fingerprint.get('header_lines', HEADER_LINES))
+    return Template(
+        name=name,
+        header=fingerprint['header'],
+        header_lines=(int(header_lines[0]), int(header_lines[1])),
+        lines=tuple(
+            (int(line['index']), re.compile(line['pattern']))
+            for line in fingerprint.get('lines', [])),
+        main=tuple(main),
+        product=product,
+    )
+
+
+def get_templates(templates_path: Optional[str]) -> Tuple[Template, ...]:
+    # Loaded and compiled once per process and path.
+    if not templates_path:
+        return ()
+    templates = _registries.get(templates_path)
+    if templates is None:
+        templates = _registries[templates_path] = load_templates(templates_path)
+    return templates
+
+
+def identify_template(
+        lines: List[str], templates: Tuple[Template, ...]) -> Optional[Tuple[Template, int]]:
+    # Returns the first template whose fingerprint matches, with the index
+    # of its product header line.
+    for template in templates:
+        if any(index >= len(lines) or not pattern.match(lines[index])
+               for index, pattern in template.lines):
+            continue
+        first, last = template.header_lines
+        for index in range(first, min(last + 1, len(lines))):
+            if lines[index].startswith(template.header):
+                return template, index
+    return None
+
+
+def load_templates(templates_path: str) -> Tuple[Template, ...]:
+    # A broken registry is logged and ignored: every invoice then goes
+    # through the generic parser.
+    try:
+        with open(templates_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return tuple(compile_template(template) for template in data['templates'])
+    except FileNotFoundError:
+        log(f"No layout templates at {templates_path}", "WARNING")
+        return ()
+    except Exception as e:
+        error = f"Error loading layout templates {templates_path}: {e}"
+        log(error, "ERROR")
+        return ()
+
+
+def registry_version(templates_path: Optional[str]) -> str:
+    # Short hash of the registry file, so editing templates reconverts files
+    # the way a parser change does.
+    if not templates_path:
+        return ''
+    version = _versions.get(templates_path)
+    if version is None:
+        try:
+            with open(templates_path, 'rb') as f:
+                version = hashlib.sha256(f.read()).hexdigest()[:12]
+        except OSError:
+            version = ''
+        _versions[templates_path] = version
+    return version
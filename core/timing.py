@@ -0,0 +1,163 @@
+import json
+import os
+import time
+
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from core.logger import zlog as log
+
+
+# Per-file stages in pipeline order. A stage is only recorded once it
+# finishes, so the first missing stage of a failed file is where it failed.
+FILE_STAGES = ('open', 'extract', 'map', 'write', 'format')
+# csv / jsonl output has no formatting step.
+TEXT_OUTPUT_STAGES = ('open', 'extract', 'map', 'write')
+RUN_STAGES = ('scan',)
+
+SLOWEST_FILES = 10
+
+Stage_Timings = Dict[str, float]
+
+
+class RunReport:
+    # Collects the stage timings of every file in a run and summarizes them
+    # as percentiles, throughput, the slowest files and failures per stage.
+
+    def __init__(self, target_dir: str, file_stages: Tuple[str, ...] = FILE_STAGES):
+        self.target_dir = target_dir
+        self.file_stages = file_stages
+        self.started = time.perf_counter()
+        self.stages: Dict[str, List[float]] = {
+            stage: [] for stage in RUN_STAGES + FILE_STAGES}
+        self.files: List[Tuple[float, str]] = []
+        self.failures: Dict[str, int] = {}
+        self.quarantined: List[Dict[str, str]] = []
+        self.duplicates: List[Dict[str, Any]] = []
+        self.converted = 0
+        self.skipped = 0
+
+    def add_file(self, pdf_path: str, timings: Stage_Timings, converted: bool) -> None:
+        for stage, seconds in timings.items():
+            if stage in self.stages:
+                self.stages[stage].append(seconds)
+        self.files.append((sum(timings.values()), pdf_path))
+        if converted:
+            self.converted += 1
+        else:
+            stage = failed_stage(timings, self.file_stages)
+            self.failures[stage] = self.failures.get(stage, 0) + 1
+
+    def add_duplicate(self, pdf_path: str, kind: str, original: str, skipped: bool) -> None:
+        self.duplicates.append({
+            'file': os.path.relpath(pdf_path, self.target_dir),
+            'kind': kind,
+            'of': original,
+            'skipped': skipped,
+        })
+
+    def add_quarantined(self, pdf_path: str, reason: str, stage: str) -> None:
+        self.quarantined.append({
+            'file': os.path.relpath(pdf_path, self.target_dir),
+            'reason': reason,
+            'stage': stage,
+        })
+
+    def add_span(self, stage: str, seconds: float) -> None:
+        self.stages[stage].append(seconds)
+
+    def summary(self, slowest: int = SLOWEST_FILES) -> Dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            'target_dir': self.target_dir,
+            'finished': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'seconds': elapsed,
+            'files': len(self.files),
+            'converted': self.converted,
+            'skipped': self.skipped,
+            'files_per_second': len(self.files) / elapsed if elapsed else 0.0,
+            'stages': {
+                stage: summarize(values)
+                for stage, values in self.stages.items() if values},
+            'failures': dict(self.failures),
+            'quarantined': list(self.quarantined),
+            'duplicates': list(self.duplicates),
+            'slowest': [
+                {'file': os.path.relpath(pdf_path, self.target_dir), 'seconds': seconds}
+                for seconds, pdf_path in sorted(self.files, reverse=True)[:slowest]],
+        }
+
+
+def failed_stage(
+        timings: Stage_Timings, file_stages: Tuple[str, ...] = FILE_STAGES) -> str:
+    for stage in file_stages:
+        if stage not in timings:
+            return stage
+    return file_stages[-1]
+
+
+def format_summary(summary: Dict) -> str:
+    lines = [
+        f"Run summary: {summary['converted']} of {summary['files']} PDF(s) converted, "
+        f"{summary['skipped']} skipped, {summary['seconds']:.2f}s "
+        f"({summary['files_per_second']:.1f} files/sec)",
+    ]
+    for stage, stats in summary['stages'].items():
+        lines.append(
+            f"  {stage:<10} p50 {stats['p50'] * 1000:8.1f} ms  "
+            f"p95 {stats['p95'] * 1000:8.1f} ms  max {stats['max'] * 1000:8.1f} ms")
+    for stage, count in summary['failures'].items():
+        lines.append(f"  failed at {stage}: {count}")
+    duplicates = summary.get('duplicates', [])
+    if duplicates:
+        skipped = sum(1 for entry in duplicates if entry['skipped'])
+        lines.append(
+            f"  duplicates: {skipped} skipped, {len(duplicates) - skipped} flagged "
+            f"(see the run report)")
+    for entry in summary.get('quarantined', []):
+        lines.append(f"  quarantined ({entry['reason']} at {entry['stage']}): {entry['file']}")
+    if summary['slowest']:
+        slowest = summary['slowest'][0]
+        lines.append(f"  slowest: {slowest['file']} ({slowest['seconds']:.2f}s)")
+    return '\n'.join(lines)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def save_report(report_path: str, summary: Dict) -> bool:
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+        temp_path = f"{report_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        os.replace(temp_path, report_path)
+        return True
+    except Exception as e:
+        error = f"Error saving run report -> {report_path}: {e}"
+        log(error, "ERROR")
+        return False
+
+
+@contextmanager
+def span(timings: Optional[Stage_Timings], stage: str) -> Iterator[None]:
+    # Nothing is recorded when the body raises.
+    started = time.perf_counter()
+    yield
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        'count': len(values),
+        'total': sum(values),
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'max': max(values) if values else 0.0,
+    }
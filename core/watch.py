@@ -0,0 +1,340 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from core.logger import flush_logs, get_log_dir, replay_logs
+from core.filer import file_sha256
+from core.isolate import OUTCOME_DONE, WorkerPool
+from core.logger import zlog as log
+from core.manifest import Manifest, is_up_to_date, load_manifest, save_manifest
+from core.process import (
+    batch_convert, get_manifest_version, get_output_path, get_quarantine_path, map_job,
+    open_dedup_index, record_conversion, report_duplicate, report_stopped, write_row)
+from core.quarantine import (
+    is_quarantined, load_quarantine, quarantine_file, release_file, save_quarantine)
+from core.scan import is_excluded, is_included, is_pdf, is_pruned, iter_pdfs
+from core.settings import Settings
+
+
+# A PDF is converted once its size and mtime have not changed for this long,
+# so files that are still being copied in are not picked up half written.
+DEBOUNCE_SECONDS = 2.0
+POLL_INTERVAL = 2.0
+TICK_SECONDS = 0.5
+
+# From <sys/inotify.h>.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+File_Signature = Tuple[int, int]
+
+
+class Watcher:
+    name = ''
+
+    def __init__(self, target_dir: str, settings: Settings):
+        self.target_dir = target_dir
+        self.settings = settings
+
+    def close(self) -> None:
+        pass
+
+    def wait(self, timeout: float) -> List[str]:
+        # Returns the PDFs that appeared or changed, waiting up to timeout.
+        raise NotImplementedError
+
+
+class InotifyWatcher(Watcher):
+    name = 'inotify'
+
+    def __init__(self, target_dir: str, settings: Settings):
+        super().__init__(target_dir, settings)
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories: Dict[int, str] = {}
+        self.log_dir = os.path.realpath(get_log_dir())
+        self.add_tree(target_dir)
+
+    def add_tree(self, directory: str) -> List[str]:
+        # Watches a directory and its subdirectories, returning the PDFs that
+        # were already inside (created before the watch existed). Folders and
+        # files are filtered like a batch scan (see scan.py).
+        pdf_paths = []
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [
+                name for name in dirs if self.is_watched_directory(os.path.join(root, name))]
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                error = f"Failed to watch {root}: {os.strerror(ctypes.get_errno())}"
+                log(error, "WARNING")
+                continue
+            self.directories[wd] = root
+            pdf_paths.extend(
+                path for path in (os.path.join(root, name) for name in files)
+                if self.is_watched_file(path))
+        return pdf_paths
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+    def is_watched_directory(self, path: str) -> bool:
+        relative_path = self.relative(path)
+        if self.settings.max_depth is not None and (
+                relative_path.count('/') + 1 > self.settings.max_depth):
+            return False
+        return not (
+            is_pruned(os.path.basename(path), path, self.settings, self.log_dir) or
+            is_excluded(relative_path, self.settings))
+
+    def is_watched_file(self, path: str) -> bool:
+        relative_path = self.relative(path)
+        return is_pdf(path) and is_included(relative_path, self.settings) and not is_excluded(
+            relative_path, self.settings)
+
+    def read_events(self) -> Iterator[Tuple[int, int, str]]:
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                yield wd, mask, name
+
+    def relative(self, path: str) -> str:
+        return os.path.relpath(path, self.target_dir).replace(os.sep, '/')
+
+    def wait(self, timeout: float) -> List[str]:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        pdf_paths = []
+        for wd, mask, name in self.read_events():
+            if mask & IN_Q_OVERFLOW:
+                log("inotify queue overflowed, rescanning", "WARNING")
+                pdf_paths.extend(self.add_tree(self.target_dir))
+                continue
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                continue
+            directory = self.directories.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if self.is_watched_directory(path):
+                    pdf_paths.extend(self.add_tree(path))
+            elif self.is_watched_file(path):
+                pdf_paths.append(path)
+        return pdf_paths
+
+
+class PollingWatcher(Watcher):
+    # Fallback for platforms without inotify: rescans the tree every
+    # POLL_INTERVAL seconds and reports files whose size or mtime changed.
+    name = 'polling'
+
+    def __init__(self, target_dir: str, settings: Settings):
+        super().__init__(target_dir, settings)
+        self.snapshot = self.scan()
+        self.scanned = time.monotonic()
+
+    def scan(self) -> Dict[str, File_Signature]:
+        # The same walk and filters as a batch run.
+        snapshot = {}
+        for pdf in iter_pdfs(self.target_dir, self.settings):
+            signature = file_signature(pdf.path)
+            if signature is not None:
+                snapshot[pdf.path] = signature
+        return snapshot
+
+    def wait(self, timeout: float) -> List[str]:
+        remaining = self.scanned + POLL_INTERVAL - time.monotonic()
+        if remaining > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0.0, remaining))
+        snapshot = self.scan()
+        self.scanned = time.monotonic()
+        changed = [
+            path for path, signature in snapshot.items()
+            if self.snapshot.get(path) != signature]
+        self.snapshot = snapshot
+        return changed
+
+
+def file_signature(path: str) -> Optional[File_Signature]:
+    try:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return None
+
+
+def open_watcher(target_dir: str, settings: Settings, polling: bool = False) -> Watcher:
+    if not polling:
+        try:
+            return InotifyWatcher(target_dir, settings)
+        except (AttributeError, OSError) as e:
+            log(f"inotify unavailable, falling back to polling: {e}", "WARNING")
+    return PollingWatcher(target_dir, settings)
+
+
+def settled_files(
+        pending: Dict[str, Tuple[Optional[File_Signature], float]],
+        now: float) -> List[str]:
+    # Updates each pending file's signature and returns those that have not
+    # changed for DEBOUNCE_SECONDS. Files that disappeared are dropped.
+    settled = []
+    for path, (signature, since) in list(pending.items()):
+        current = file_signature(path)
+        if current is None:
+            del pending[path]
+        elif current != signature:
+            pending[path] = (current, now)
+        elif now - since >= DEBOUNCE_SECONDS:
+            settled.append(path)
+    return settled
+
+
+def watch_folder(target_dir: str, settings: Settings, polling: bool = False) -> bool:
+    # Catch up on anything that arrived while we were not running, then
+    # convert new PDFs as they settle instead of rescanning the tree.
+    batch_convert(target_dir, settings)
+
+    watcher = open_watcher(target_dir, settings, polling)
+    log(f"Watching {target_dir} for new PDFs ({watcher.name})", "INFO", True)
+
+    manifests: Dict[str, Manifest] = {}
+    quarantine_path = get_quarantine_path(target_dir, settings)
+    quarantine = load_quarantine(quarantine_path)
+    dedup = open_dedup_index(target_dir, settings)
+    skip_duplicates = settings.dedup == 'skip'
+    pending: Dict[str, Tuple[Optional[File_Signature], float]] = {}
+    # Output folders are created before the first write into them, like
+    # write_stage, so folders whose PDFs all fail are left alone.
+    created = set()
+    # One file per worker, each under the file time and memory budgets;
+    # settled files wait in pending until a worker is free. Workers extract
+    # and map, and the workbook is written here, once the invoice has been
+    # checked against the dedup index.
+    pool = WorkerPool(map_job, settings)
+    try:
+        while True:
+            now = time.monotonic()
+            for pdf_path in watcher.wait(TICK_SECONDS):
+                if pdf_path not in pending:
+                    pending[pdf_path] = (None, now)
+
+            finished = pool.collect()
+            for isolated in finished:
+                pdf_path, _, sha256 = isolated.job
+                excel_path = isolated.tag
+                processed_folder = os.path.dirname(excel_path)
+                relative_path = os.path.relpath(pdf_path, target_dir)
+                converted = False
+                if isolated.outcome == OUTCOME_DONE:
+                    _, invoice, records, timings = isolated.result
+                    replay_logs(records)
+                    if invoice is not None and dedup is not None and dedup.check_invoice(
+                            pdf_path, invoice, skip_duplicates):
+                        report_duplicate(None, dedup, pdf_path, skip_duplicates)
+                        if skip_duplicates:
+                            release_file(quarantine, relative_path)
+                            continue
+                    if invoice is not None:
+                        if processed_folder not in created:
+                            try:
+                                os.makedirs(processed_folder, exist_ok=True)
+                                created.add(processed_folder)
+                            except OSError as e:
+                                log(f"Error creating {processed_folder}: {e}", "ERROR")
+                        converted = write_row(pdf_path, excel_path, invoice, settings, timings)
+                    if converted:
+                        release_file(quarantine, relative_path)
+                else:
+                    stage = report_stopped(isolated, settings)
+                    quarantine_file(quarantine, relative_path, pdf_path, isolated.outcome, stage)
+                if not converted and dedup is not None:
+                    dedup.release(pdf_path)
+                record_conversion(manifests, pdf_path, excel_path, converted, sha256)
+                if os.path.isdir(processed_folder):
+                    save_manifest(processed_folder, manifests[processed_folder])
+            if finished:
+                save_quarantine(quarantine_path, quarantine)
+                if dedup is not None:
+                    dedup.save()
+                flush_logs()
+
+            busy = {worker.job[0] for worker in pool.busy()}
+            for pdf_path in settled_files(pending, time.monotonic()):
+                if not pool.has_capacity():
+                    break
+                if pdf_path in busy:
+                    continue
+                del pending[pdf_path]
+
+                excel_path = get_output_path(pdf_path, settings)
+                processed_folder = os.path.dirname(excel_path)
+                if processed_folder not in manifests:
+                    manifests[processed_folder] = load_manifest(
+                        processed_folder, get_manifest_version(settings))
+                if not settings.force:
+                    if is_quarantined(
+                            quarantine, os.path.relpath(pdf_path, target_dir), pdf_path):
+                        log(f"Skipped quarantined {pdf_path} (--force retries it)", "WARNING")
+                        continue
+                    if is_up_to_date(manifests[processed_folder], pdf_path, excel_path):
+                        continue
+
+                # Hashed once here for the dedup index, the cache and the manifest.
+                if dedup is None:
+                    sha256 = file_sha256(pdf_path)
+                else:
+                    original, sha256 = dedup.check_file(pdf_path, recheck=settings.force)
+                    if original is not None:
+                        # A quarantined PDF retried with --force can resolve to a copy.
+                        release_file(quarantine, os.path.relpath(pdf_path, target_dir))
+                        report_duplicate(None, dedup, pdf_path, True)
+                        save_quarantine(quarantine_path, quarantine)
+                        dedup.save()
+                        continue
+                pool.submit((pdf_path, settings, sha256), excel_path)
+    except KeyboardInterrupt:
+        log(f"Stopped watching {target_dir}", "INFO", True)
+    except Exception as e:
+        error = f"Error watching {target_dir}: {e}"
+        log(error, "FATAL")
+        raise Exception(error)
+    finally:
+        if dedup is not None:
+            # Files still converting when the watch stopped give up their keys.
+            for worker in pool.busy():
+                dedup.release(worker.job[0])
+            dedup.save()
+        pool.close()
+        watcher.close()
+        for processed_folder, manifest in manifests.items():
+            if os.path.isdir(processed_folder):
+                save_manifest(processed_folder, manifest)
+        save_quarantine(quarantine_path, quarantine)
+    return True
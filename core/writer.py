@@ -0,0 +1,382 @@
+import csv
+import json
+import os
+import re
+import tempfile
+import time
+
+from contextlib import contextmanager
+from typing import IO, TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from core.logger import zlog as log
+from core.settings import Settings
+
+# openpyxl is only imported when a workbook is written, so csv / jsonl runs
+# never load it.
+if TYPE_CHECKING:
+    from openpyxl.styles import PatternFill
+
+
+INDEXED_COLUMN = re.compile(r'^(.+)_(\d+)$')
+INVALID_SHEET_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+# Write buffer for the csv / jsonl sinks.
+BUFFER_SIZE = 1024 * 1024
+# TableWriter sheets are streamed, so widths cannot come from the data.
+TABLE_COLUMN_WIDTH = 12
+
+
+class ConsolidatedWriter:
+    # Rows are spooled to temporary JSON lines files while the column union is
+    # collected, then streamed into a write-only workbook (or csv / jsonl
+    # files) on close(). Memory stays flat however many invoices are added,
+    # and every sheet gets one schema instead of one per file.
+
+    def __init__(self, output_path: str, settings: Settings):
+        self.output_path = output_path
+        self.settings = settings
+        self.sheets: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, sheet_name: str, row: Dict[str, Any]) -> None:
+        sheet = self.sheets.get(sheet_name)
+        if sheet is None:
+            sheet = self.sheets[sheet_name] = {
+                'spool': tempfile.TemporaryFile('w+', encoding='utf-8'),
+                'leading': {},
+                'indexed': {},
+                'trailing': {},
+                'widths': {},
+                'rows': 0,
+            }
+
+        values = {}
+        seen_indexed = False
+        widths = sheet['widths']
+        for column, value in row.items():
+            value = to_cell_value(value)
+            values[column] = value
+            match = INDEXED_COLUMN.match(column)
+            if match:
+                seen_indexed = True
+                sheet['indexed'].setdefault(
+                    column, (int(match.group(2)), match.group(1)))
+            elif column not in sheet['leading'] and column not in sheet['trailing']:
+                sheet['trailing' if seen_indexed else 'leading'][column] = None
+            width = len(str(value)) if value is not None else 0
+            if width > widths.get(column, 0):
+                widths[column] = width
+
+        sheet['spool'].write(json.dumps(values) + '\n')
+        sheet['rows'] += 1
+
+    def close(self) -> bool:
+        try:
+            if self.settings.output_format == 'xlsx':
+                return self.write_workbook()
+            return self.write_text_files()
+        except Exception as e:
+            error = f"Error writing consolidated output -> {self.output_path}: {e}"
+            log(error, "ERROR")
+            return False
+        finally:
+            for sheet in self.sheets.values():
+                sheet['spool'].close()
+
+    def write_text_files(self) -> bool:
+        # csv / jsonl have no sheets: one file per sheet, named after the
+        # sheet when there is more than one.
+        write = write_csv if self.settings.output_format == 'csv' else write_jsonl
+        if not self.sheets:
+            return write(self.output_path, [], [])
+
+        used_titles = set()
+        base, extension = os.path.splitext(self.output_path)
+        written = True
+        for sheet_name, sheet in self.sheets.items():
+            output_path = self.output_path
+            if len(self.sheets) > 1:
+                output_path = f"{base} - {sheet_title(sheet_name, used_titles)}{extension}"
+            columns = order_columns(sheet)
+            spool: IO[str] = sheet['spool']
+            spool.seek(0)
+            rows = (
+                [values.get(column) for column in columns]
+                for values in map(json.loads, spool))
+            written = write(output_path, columns, rows) and written
+        return written
+
+    def write_workbook(self) -> bool:
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.utils import get_column_letter
+
+        wb = Workbook(write_only=True)
+        header_fill = get_header_fill(self.settings)
+        used_titles = set()
+
+        for sheet_name, sheet in self.sheets.items():
+            ws = wb.create_sheet(sheet_title(sheet_name, used_titles))
+            columns = order_columns(sheet)
+
+            for col, column in enumerate(columns, start=1):
+                width = max(len(column), sheet['widths'].get(column, 0))
+                ws.column_dimensions[get_column_letter(col)].width = width + 2
+            if columns:
+                ws.auto_filter.ref = f"A1:{get_column_letter(len(columns))}1"
+
+            header = []
+            for column in columns:
+                cell = WriteOnlyCell(ws, value=column)
+                cell.fill = header_fill
+                header.append(cell)
+            ws.append(header)
+
+            spool: IO[str] = sheet['spool']
+            spool.seek(0)
+            for line in spool:
+                values = json.loads(line)
+                ws.append([values.get(column) for column in columns])
+
+        if not self.sheets:
+            wb.create_sheet('Invoices')
+
+        with atomic_output(self.output_path) as temp_path:
+            wb.save(temp_path)
+        return True
+
+
+class TableWriter:
+    # Fixed-schema tables (one sheet, or one csv / jsonl file, per table)
+    # written row by row as they arrive. Nothing is spooled: the columns are
+    # known up front, so the header and column widths can be written first.
+    # The first table goes to output_path itself; in csv / jsonl the others
+    # go next to it as "<name> - <table><ext>". Everything is written to
+    # temporary files that replace the outputs only once close() succeeds.
+
+    def __init__(self, output_path: str, tables: Dict[str, Sequence[str]], settings: Settings):
+        self.output_path = output_path
+        self.tables = tables
+        self.settings = settings
+        self.workbook = None
+        self.sinks: Dict[str, Any] = {}
+        self.files: List[IO[str]] = []
+        self.paths: List[Tuple[str, str]] = []
+
+    def add(self, table: str, row: Sequence) -> None:
+        if not self.sinks:
+            self.open()
+        values = [to_cell_value(value) for value in row]
+        if self.settings.output_format == 'jsonl':
+            record = {
+                column: value
+                for column, value in zip(self.tables[table], values) if value is not None}
+            self.sinks[table].write(json.dumps(record) + '\n')
+        elif self.workbook is not None:
+            self.sinks[table].append(values)
+        else:
+            self.sinks[table].writerow(values)
+
+    def close(self) -> bool:
+        try:
+            if not self.sinks:
+                self.open()
+            if self.workbook is not None:
+                self.workbook.save(self.paths[0][0])
+            for f in self.files:
+                f.close()
+            for temp_path, output_path in self.paths:
+                os.replace(temp_path, output_path)
+            return True
+        except Exception as e:
+            error = f"Error writing tables -> {self.output_path}: {e}"
+            log(error, "ERROR")
+            return False
+        finally:
+            for f in self.files:
+                f.close()
+            for temp_path, _ in self.paths:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    def open(self) -> None:
+        if self.settings.output_format == 'xlsx':
+            self.open_workbook()
+            return
+        base, extension = os.path.splitext(self.output_path)
+        for index, (table, columns) in enumerate(self.tables.items()):
+            output_path = self.output_path if index == 0 else f"{base} - {table}{extension}"
+            temp_path = f"{output_path}.tmp"
+            self.paths.append((temp_path, output_path))
+            if self.settings.output_format == 'csv':
+                f = open(temp_path, 'w', encoding='utf-8', newline='', buffering=BUFFER_SIZE)
+                self.sinks[table] = csv.writer(f)
+                self.sinks[table].writerow(columns)
+            else:
+                f = open(temp_path, 'w', encoding='utf-8', buffering=BUFFER_SIZE)
+                self.sinks[table] = f
+            self.files.append(f)
+
+    def open_workbook(self) -> None:
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.utils import get_column_letter
+
+        self.workbook = Workbook(write_only=True)
+        self.paths.append((f"{self.output_path}.tmp", self.output_path))
+        header_fill = get_header_fill(self.settings)
+        for table, columns in self.tables.items():
+            ws = self.workbook.create_sheet(table)
+            for col, column in enumerate(columns, start=1):
+                width = max(len(column), TABLE_COLUMN_WIDTH)
+                ws.column_dimensions[get_column_letter(col)].width = width + 2
+            ws.auto_filter.ref = f"A1:{get_column_letter(len(columns))}1"
+            header = []
+            for column in columns:
+                cell = WriteOnlyCell(ws, value=column)
+                cell.fill = header_fill
+                header.append(cell)
+            ws.append(header)
+            self.sinks[table] = ws
+
+
+@contextmanager
+def atomic_output(output_path: str) -> Iterator[str]:
+    # Yields a temporary path next to output_path and renames it over the
+    # output once the block finishes, so an interrupted write never leaves a
+    # half-written file behind.
+    temp_path = f"{output_path}.tmp"
+    try:
+        yield temp_path
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def format_sheet(ws, widths: Sequence[int], settings: Settings) -> None:
+    from openpyxl.utils import get_column_letter
+
+    header_fill = get_header_fill(settings)
+    for cell in ws[1]:
+        cell.fill = header_fill
+
+    if widths:
+        ws.auto_filter.ref = f"A1:{get_column_letter(len(widths))}1"
+
+    for col, width in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(col)].width = width + 2
+
+
+def get_header_fill(settings: Settings) -> 'PatternFill':
+    from openpyxl.styles import PatternFill
+
+    header_start_color, header_end_color, header_fill_type = settings.header_fill
+
+    return PatternFill(
+        start_color=header_start_color,
+        end_color=header_end_color,
+        fill_type=header_fill_type
+    )
+
+
+def order_columns(sheet: Dict[str, Any]) -> List[str]:
+    positions = {column: i for i, column in enumerate(sheet['indexed'])}
+    indexed = sorted(
+        sheet['indexed'],
+        key=lambda column: (sheet['indexed'][column][0], positions[column]))
+    return list(sheet['leading']) + indexed + list(sheet['trailing'])
+
+
+def sheet_title(name: str, used_titles: set) -> str:
+    base = INVALID_SHEET_CHARS.sub('_', name).strip("'") or 'Invoices'
+    title = base[:31]
+    counter = 1
+    while title.lower() in used_titles:
+        counter += 1
+        suffix = f" ({counter})"
+        title = base[:31 - len(suffix)] + suffix
+    used_titles.add(title.lower())
+    return title
+
+
+def to_cell_value(value: Any) -> Any:
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return str(value)
+
+
+def write_excel(
+        excel_path: str, columns: Sequence[str], rows: Iterable[Sequence],
+        settings: Settings, timings: Optional[Dict[str, float]] = None) -> bool:
+    try:
+        from openpyxl import Workbook
+
+        started = time.perf_counter()
+        wb = Workbook()
+        ws = wb.active
+
+        widths: List[int] = [len(str(column)) for column in columns]
+
+        ws.append(list(columns))
+        for row in rows:
+            values = [to_cell_value(value) for value in row]
+            for col, value in enumerate(values):
+                if value is not None:
+                    widths[col] = max(widths[col], len(str(value)))
+            ws.append(values)
+
+        formatting = time.perf_counter()
+        format_sheet(ws, widths, settings)
+        saving = time.perf_counter()
+
+        with atomic_output(excel_path) as temp_path:
+            wb.save(temp_path)
+        if timings is not None:
+            finished = time.perf_counter()
+            timings['write'] = (formatting - started) + (finished - saving)
+            timings['format'] = saving - formatting
+        return True
+    except Exception as e:
+        error = f"Error writing excel -> {excel_path}: {e}"
+        log(error, "ERROR")
+        return False
+
+
+def write_csv(
+        output_path: str, columns: Sequence[str], rows: Iterable[Sequence],
+        timings: Optional[Dict[str, float]] = None) -> bool:
+    try:
+        started = time.perf_counter()
+        with atomic_output(output_path) as temp_path, open(
+                temp_path, 'w', encoding='utf-8', newline='', buffering=BUFFER_SIZE) as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows([to_cell_value(value) for value in row] for row in rows)
+        if timings is not None:
+            timings['write'] = time.perf_counter() - started
+        return True
+    except Exception as e:
+        error = f"Error writing csv -> {output_path}: {e}"
+        log(error, "ERROR")
+        return False
+
+
+def write_jsonl(
+        output_path: str, columns: Sequence[str], rows: Iterable[Sequence],
+        timings: Optional[Dict[str, float]] = None) -> bool:
+    try:
+        started = time.perf_counter()
+        with atomic_output(output_path) as temp_path, open(
+                temp_path, 'w', encoding='utf-8', buffering=BUFFER_SIZE) as f:
+            for row in rows:
+                record = {
+                    column: to_cell_value(value)
+                    for column, value in zip(columns, row) if value is not None}
+                f.write(json.dumps(record) + '\n')
+        if timings is not None:
+            timings['write'] = time.perf_counter() - started
+        return True
+    except Exception as e:
+        error = f"Error writing jsonl -> {output_path}: {e}"
+        log(error, "ERROR")
+        return False